@@ -1,64 +1,30 @@
 import streamlit as st
-import os
-import requests
-import json
-import time
-import google.generativeai as genai
-from tavily import TavilyClient
-from PIL import Image, ImageDraw, ImageFont
+import uuid
+import pipeline
+import tracing
+import ui_resources
+from pipeline import format_judge, clear_my_boards
 
 # ==========================================
 # 0. 設定與 API Keys
 # ==========================================
 st.set_page_config(page_title="北科大 AI 課程推薦系統", layout="wide")
+# 每個瀏覽器 session 的識別碼，記錄榜單卡片由誰加入
+if "session_id" not in st.session_state: st.session_state.session_id = uuid.uuid4().hex
 
-def get_secret(key):
-    if key in st.secrets:
-        return st.secrets[key]
-    if os.getenv(key):
-        return os.getenv(key)
-    return None
+config = dict(ui_resources.secret_config())
 
-GEMINI_API_KEY = get_secret("GEMINI_API_KEY")
-GOOGLE_SEARCH_API_KEY = get_secret("GOOGLE_SEARCH_API_KEY")
-SEARCH_ENGINE_ID = get_secret("SEARCH_ENGINE_ID")
-TAVILY_API_KEY = get_secret("TAVILY_API_KEY")
-
-if not GEMINI_API_KEY:
+if not config["GEMINI_API_KEY"]:
     with st.sidebar:
         st.warning("請輸入 API Keys")
-        GEMINI_API_KEY = st.text_input("Gemini API Key", type="password")
-        GOOGLE_SEARCH_API_KEY = st.text_input("Google Search Key", type="password")
-        SEARCH_ENGINE_ID = st.text_input("Search Engine ID")
-        TAVILY_API_KEY = st.text_input("Tavily API Key", type="password")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-
-# ==========================================
-# 1. 模型定義
-# ==========================================
-MODELS = {
-    "MANAGER":        "models/gemini-2.5-flash",
-    "CLEANER":        "models/gemini-2.5-flash",
-    
-    "JUDGE_A_Gemma":  "models/gemma-3-27b-it",
-    "JUDGE_A_Gemini": "models/gemini-2.5-flash",
-    "JUDGE_B_Gemma":  "models/gemma-3-27b-it",
-    "JUDGE_B_Gemini": "models/gemini-2.5-flash",
-    
-    "SYNTHESIZER":    "models/gemini-2.5-flash",
-    "FIXER":          "models/gemini-2.5-flash-lite",
-    "HUNTER":         "models/gemini-2.5-flash"
-}
-
-# ==========================================
-# 2. 側邊欄與狀態管理
-# ==========================================
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-
-def get_tier_filename(list_type, lang="zh"):
-    suffix = "_en" if lang == "en" else ""
-    return f"tier_list_{list_type}{suffix}.png" if list_type != "Total" else f"final_tier_list{suffix}.png"
+        config["GEMINI_API_KEY"] = st.text_input("Gemini API Key", type="password")
+        config["GOOGLE_SEARCH_API_KEY"] = st.text_input("Google Search Key", type="password")
+        config["SEARCH_ENGINE_ID"] = st.text_input("Search Engine ID")
+        config["TAVILY_API_KEY"] = st.text_input("Tavily API Key", type="password")
+SETTINGS = pipeline.configure(config.get)
+# 本 session 的 API key；送出分析時一併交給背景工作 (SETTINGS 為全行程共用，可能被其他 session 改寫)
+CREDENTIALS = pipeline.credentials(config.get)
+GEMINI_API_KEY = CREDENTIALS["GEMINI_API_KEY"]
 
 with st.sidebar:
     st.title("系統資源")
@@ -76,272 +42,59 @@ with st.sidebar:
                 st.error("發生錯誤")
 
     update_sidebar_status("System", "Ready", "idle")
+    stats = ui_resources.cache_stats()
+    cache_stats, llm_stats, spec_stats = stats["search"], stats["llm"], stats["speculation"]
+    st.caption(f"搜尋快取：{cache_stats['entries']} 筆 (命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']})"
+               + (" · 離線重播" if SETTINGS["SEARCH_OFFLINE"] else ""))
+    st.caption(f"LLM 快取：{llm_stats['entries']} 筆 (命中 {llm_stats['hits']} / 未命中 {llm_stats['misses']})")
+    if spec_stats["hits"] + spec_stats["misses"]:
+        st.caption(f"預先搜尋：命中 {spec_stats['hits']} / 落空 {spec_stats['misses']} ({spec_stats['hit_rate']:.0%})")
+    verdict_stats = stats["verdicts"]
+    st.caption(f"分析結果庫：{verdict_stats['entries']} 門課 (累計查詢 {verdict_stats['queries']} 次)")
+    if pipeline.MODEL_SELECTION:
+        st.caption(f"模型：依延遲設定檔調整 {len(pipeline.MODEL_SELECTION)} 個角色 (check_models.py)")
+    job_stats = pipeline.job_manager().stats()
+    st.caption(f"分析工作：執行中 {job_stats['running']} / 排隊 {job_stats['queued']} · 合併重複查詢 {job_stats['merged']} 次")
+    trace_placeholder = st.empty()
+
+    def show_trace(trace_dict):
+        """上一次查詢各階段的時間瀑布圖"""
+        summary = tracing.summarize(trace_dict)
+        rows = [{"span": f"{i:02d} {s['name']}", "start": s["start"], "end": s["start"] + s["duration"],
+                 "duration": s["duration"], "model": s.get("model", ""), "cache": s.get("cache", "-"),
+                 "tokens": (s.get("prompt_tokens") or 0) + (s.get("response_tokens") or 0)}
+                for i, s in enumerate(trace_dict["spans"])]
+        with trace_placeholder.container():
+            st.subheader("上次查詢耗時")
+            st.caption(f"總計 {summary['duration']:.1f}s · LLM {summary['llm_calls']} 次 · 快取命中 {summary['cache_hits']} · "
+                       f"fallback {summary['fallbacks']} · tokens {summary['prompt_tokens']}→{summary['response_tokens']}")
+            st.vega_lite_chart({
+                "data": {"values": rows},
+                "mark": "bar",
+                "encoding": {
+                    "y": {"field": "span", "type": "nominal", "sort": None, "title": None},
+                    "x": {"field": "start", "type": "quantitative", "title": "秒"},
+                    "x2": {"field": "end"},
+                    "color": {"field": "cache", "type": "nominal", "legend": {"orient": "bottom"}},
+                    "tooltip": [{"field": f} for f in ("span", "duration", "model", "cache", "tokens")],
+                },
+            }, use_container_width=True)
+
+    if st.session_state.get("last_trace"): show_trace(st.session_state.last_trace)
     st.divider()
     
     version_option = st.radio("tier list語言版本", ("中文", "英文"), index=0)
     CURRENT_LANG = "en" if version_option == "英文" else "zh"
-    
-    if version_option == "中文":
-        BASE_IMAGE_FILENAME = "tier_list.png"
-    else:
-        BASE_IMAGE_FILENAME = "tier_list_en.png"
 
-    BASE_IMAGE_PATH = os.path.join(BASE_DIR, BASE_IMAGE_FILENAME)
-
-    if "tier_counts" not in st.session_state or "zh" not in st.session_state.tier_counts:
-        st.session_state.tier_counts = {
-            "zh": { "A": {'S':0,'A':0,'B':0,'C':0,'D':0}, "B": {'S':0,'A':0,'B':0,'C':0,'D':0}, "Total": {'S':0,'A':0,'B':0,'C':0,'D':0} },
-            "en": { "A": {'S':0,'A':0,'B':0,'C':0,'D':0}, "B": {'S':0,'A':0,'B':0,'C':0,'D':0}, "Total": {'S':0,'A':0,'B':0,'C':0,'D':0} }
-        }
-    if st.button("清空所有榜單", type="primary"):
-        for lang in ["zh", "en"]:
-            for l_type in ["A", "B", "Total"]:
-                fname = get_tier_filename(l_type, lang)
-                path = os.path.join(BASE_DIR, fname)
-                if os.path.exists(path): os.remove(path)
-                st.session_state.tier_counts[lang][l_type] = {'S':0,'A':0,'B':0,'C':0,'D':0}
-            
+    # 榜單為所有使用者共用，這裡只移除自己加入的卡片
+    if st.button("清空我加入的榜單", type="primary"):
+        clear_my_boards(st.session_state.session_id)
+        ui_resources.boards_changed()
         st.session_state.analysis_result = None
         st.session_state.judge_results = None
-        st.success("已重置所有榜單")
+        st.success("已移除你加入的課程")
         st.rerun()
 
-# ==========================================
-# 3. 圖片處理
-# ==========================================
-def load_font(size):
-    paths = ["/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc", "C:\\Windows\\Fonts\\msjh.ttc", "C:\\Windows\\Fonts\\simhei.ttf"]
-    for p in paths:
-        if os.path.exists(p): return ImageFont.truetype(p, size)
-    return ImageFont.load_default()
-
-def get_fit_font(draw, text, max_width, max_height, initial_size):
-    size = initial_size
-    font = load_font(size)
-    while size > 10: 
-        try:
-            l, t, r, b = draw.textbbox((0, 0), text, font=font)
-            w, h = r - l, b - t
-        except: w, h = draw.textlength(text, font=font), size
-        if w < max_width and h < max_height: return font, h
-        size -= 2
-        font = load_font(size)
-    return font, max_height
-
-def create_base_tier_list_fallback():
-    W, H = 1200, 1000
-    img = Image.new('RGB', (W, H), (30, 30, 30))
-    draw = ImageDraw.Draw(img)
-    colors = {'S': '#FF7F7F', 'A': '#FFBF7F', 'B': '#FFFF7F', 'C': '#7FFF7F', 'D': '#7F7FFF'}
-    row_h = H // 5
-    font = load_font(60)
-    for idx, (tier, color) in enumerate(colors.items()):
-        y = idx * row_h
-        draw.rectangle([(0, y), (200, y + row_h)], fill=color)
-        draw.rectangle([(0, y), (W, y + row_h)], outline='black', width=2)
-        draw.text((70, y + row_h//2 - 30), tier, fill='black', font=font)
-        draw.line([(0, y+row_h), (W, y+row_h)], fill='white', width=2)
-    return img
-
-def create_course_card(full_text, size=(150, 150)):
-    img = Image.new('RGBA', size, (245, 245, 245, 255))
-    draw = ImageDraw.Draw(img)
-    draw.rectangle([(0,0), (size[0]-1, size[1]-1)], outline=(50,50,50), width=3)
-    parts = full_text.split(' ')
-    course_name = parts[0] if len(parts) >= 1 else full_text
-    teacher_name = " ".join(parts[1:]) if len(parts) >= 2 else ""
-    W, H = size
-    target_w = W - 16
-    font_c, h_c = get_fit_font(draw, course_name, target_w, H*0.5, int(H*0.4))
-    try: l, t, r, b = draw.textbbox((0,0), course_name, font=font_c); w_c = r-l
-    except: w_c = draw.textlength(course_name, font=font_c)
-    draw.text(((W-w_c)/2, (H*0.45-h_c)/2), course_name, fill='black', font=font_c)
-    if teacher_name:
-        font_t, h_t = get_fit_font(draw, teacher_name, target_w, H*0.3, int(H*0.25))
-        try: l, t, r, b = draw.textbbox((0,0), teacher_name, font=font_t); w_t = r-l
-        except: w_t = draw.textlength(teacher_name, font=font_t)
-        draw.text(((W-w_t)/2, (H*0.75)-(h_t/2)), teacher_name, fill='gray', font=font_t)
-    return img
-
-def update_tier_list_image(list_type, course_name, tier, lang="zh"):
-    tier = tier.upper()
-    if tier not in ['S', 'A', 'B', 'C', 'D']: tier = 'C'
-    
-    target_filename = get_tier_filename(list_type, lang)
-    target_path = os.path.join(BASE_DIR, target_filename)
-    
-    current_base_img_name = "tier_list.png" if lang == "zh" else "tier_list_en.png"
-    current_base_img_path = os.path.join(BASE_DIR, current_base_img_name)
-
-    if os.path.exists(target_path): base = Image.open(target_path).convert("RGBA")
-    elif os.path.exists(current_base_img_path): base = Image.open(current_base_img_path).convert("RGBA")
-    else: base = create_base_tier_list_fallback().convert("RGBA")
-    
-    W, H = base.size
-    ROW_H = H // 5
-    CARD_SIZE = int(ROW_H * 0.85)
-    START_X = int(W * 0.28)
-    PADDING = 10
-    
-    count = st.session_state.tier_counts[lang][list_type][tier]
-    x = START_X + (count * (CARD_SIZE + PADDING))
-    y = int(({'S':0,'A':1,'B':2,'C':3,'D':4}[tier] * ROW_H) + (ROW_H - CARD_SIZE)/2)
-    
-    if x + CARD_SIZE > W: return False
-    
-    card = create_course_card(course_name, size=(CARD_SIZE, CARD_SIZE))
-    base.alpha_composite(card, (int(x), int(y)))
-    base.save(target_path)
-    
-    st.session_state.tier_counts[lang][list_type][tier] += 1
-    return True
-
-# ==========================================
-# 4. Agent 邏輯
-# ==========================================
-def call_ai(contents, model_name):
-    try:
-        model = genai.GenerativeModel(model_name)
-        return model.generate_content(contents).text
-    except Exception as e:
-        try:
-            fallback = genai.GenerativeModel("models/gemini-2.0-flash")
-            return fallback.generate_content(contents).text
-        except: return None
-
-def agent_manager(user_query):
-    prompt = f"""
-    使用者輸入：「{user_query}」
-    判斷意圖並輸出 JSON：
-    1. 推薦模式 (intent: "recommend"): 僅有課程名 -> keywords: 課程名
-    2. 分析模式 (intent: "analyze"): 含老師名 -> keywords: 老師名
-    JSON format: {{"intent": "...", "keywords": "...", "reason": "..."}}
-    """
-    res = call_ai(prompt, MODELS["MANAGER"])
-    try: 
-        data = json.loads(res.replace("```json","").replace("```","").strip())
-        if not data.get("keywords") or len(str(data.get("keywords")).strip()) == 0:
-            data["keywords"] = user_query
-        return data
-    except: return {"intent": "recommend", "keywords": user_query}
-
-def search_hybrid(query, mode="analysis"):
-    results = []
-    if GOOGLE_SEARCH_API_KEY and SEARCH_ENGINE_ID:
-        try:
-            q_str = f'(北科大 "{query}") OR ("{query}" Dcard PTT)' if mode == "analysis" else f'北科大 {query} 推薦'
-            url = "https://www.googleapis.com/customsearch/v1"
-            params = {'key': GOOGLE_SEARCH_API_KEY, 'cx': SEARCH_ENGINE_ID, 'q': q_str, 'num': 5}
-            res = requests.get(url, params=params, timeout=5)
-            if res.status_code == 200:
-                for item in res.json().get('items', []):
-                    results.append(f"[Google] {item.get('title')}\n{item.get('snippet')}\nLink: {item.get('link')}")
-        except Exception as e: print(f"Google Error: {e}")
-
-    if TAVILY_API_KEY:
-        try:
-            tavily = TavilyClient(api_key=TAVILY_API_KEY)
-            tav_res = tavily.search(query=f"北科大 {query} 評價 Dcard PTT", search_depth="advanced", max_results=5)
-            for item in tav_res.get('results', []):
-                content = item.get('content', '')[:300]
-                results.append(f"[Tavily] {item.get('title')}\n{content}\nLink: {item.get('url')}")
-        except Exception as e: print(f"Tavily Error: {e}")
-
-    if not results: return []
-    unique_results = {}
-    for r in results:
-        link = r.split("Link: ")[-1].strip()
-        if link not in unique_results: unique_results[link] = r
-    return list(unique_results.values())
-        
-def agent_cleaner(course_name, raw_data):
-    """資料清理專員"""
-    prompt = f"""
-    你是資料過濾專家。查詢目標：「{course_name}」。
-    任務：過濾雜訊，保留北科大/教學相關完整資料。
-    
-    規則：
-    1. 完整保留原文，不摘要。
-    2. 刪除無關雜訊(廣告/導航/亂碼)。
-    3. 特別保留「北科課程好朋友」數據。
-    
-    強制輸出格式 (請勿使用標題語法 #，改用粗體)：
-    ---------------------------
-    【來源】：[連結標題](連結網址)
-    【內文】：
-    (內容...)
-    ---------------------------
-    
-    資料：{raw_data}
-    """
-    return call_ai(prompt, MODELS["CLEANER"])
-    
-def agent_judge_panel(course_name, data):
-    base_prompt = f"""
-    目標：「{course_name}」。資料：{data}。
-    請評分並給予 Tier (S/A/B/C/D)。
-    **務必輸出純 JSON 格式**：{{ "tier": "S", "score": 95, "comment": "簡短評語" }}
-    """
-    prompt_a = f"你是【嚴格學術派教授】。專注：紮實度、專業性。{base_prompt}"
-    prompt_b = f"你是【想輕鬆通過的同學】。專注：甜度、好過。{base_prompt}"
-    
-    res_a_gemma = call_ai(prompt_a, MODELS["JUDGE_A_Gemma"])
-    res_a_gemini = call_ai(prompt_a, MODELS["JUDGE_A_Gemini"])
-    res_b_gemma = call_ai(prompt_b, MODELS["JUDGE_B_Gemma"])
-    res_b_gemini = call_ai(prompt_b, MODELS["JUDGE_B_Gemini"])
-    
-    def parse_judge(raw_text):
-        try: return json.loads(raw_text.replace("```json","").replace("```","").strip())
-        except: return {"tier": "C", "score": 70, "comment": str(raw_text)[:100]}
-
-    return {
-        "A_Gemma": parse_judge(res_a_gemma),
-        "A_Gemini": parse_judge(res_a_gemini),
-        "B_Gemma": parse_judge(res_b_gemma),
-        "B_Gemini": parse_judge(res_b_gemini)
-    }
-
-def agent_synthesizer(course_name, panel_results):
-    import json
-    panel_text = json.dumps(panel_results, ensure_ascii=False, indent=2)
-    prompt = f"""
-    你是最終決策長 (Synthesizer)。目標：「{course_name}」。
-    意見：{panel_text}
-    任務：
-    1. 計算最終分數與 Tier。
-    2. 新增星星評等 (內涵/輕鬆/甜度)。
-    3. 總結短評。
-    JSON 範例：
-    {{
-        "rank": "硬核大刀", "tier": "B", "score": 75,
-        "star_ratings": {{ "learning": "★★★★★", "chill": "★★☆☆☆", "sweet": "★★☆☆☆" }},
-        "reason": "...", "tags": [], "details": "..."
-    }}
-    """
-    return call_ai(prompt, MODELS["SYNTHESIZER"])
-
-def agent_hunter(topic, data):
-    prompt = f"""
-    你是北科大選課獵頭。使用者想找：「{topic}」。
-    
-    參考資料 (已過濾)：
-    {data}
-    
-    請推薦 **3 門** 最符合需求的課程或老師。
-    
-    請務必使用 **Markdown 表格** 呈現，欄位如下(推薦指數用★★★★★表示)：
-    | 課程 | 老師 | 推薦指數 | 核心推薦理由 |
-    |---|---|---|---|
-    
-    (請在表格下方補充一段總結建議)
-    """
-    return call_ai(prompt, MODELS["HUNTER"])
-
-def agent_fixer(text):
-    res = call_ai(f"Extract valid JSON:\n{text}", MODELS["FIXER"])
-    try: return json.loads(res.replace("```json","").replace("```","").strip())
-    except: return None
-
 # ==========================================
 # 5. 主介面邏輯
 # ==========================================
@@ -349,108 +102,123 @@ st.title("北科大 AI 課程推薦系統")
 st.caption("(Powered by Google AI Studio)")
 
 c1, c2 = st.columns([4, 1], vertical_alignment="bottom")
-with c1: user_input = st.text_input("輸入「課程 老師」「老師」以查找評價，輸入「課程」以查找推薦教師", placeholder="例：物理 施坤龍")
+with c1: user_input = st.text_input("輸入「課程 老師」「老師」以查找評價，輸入「課程」以查找推薦教師", placeholder="例：物理 施坤龍", key="query")
 with c2: btn_search = st.button("智能搜尋", use_container_width=True, type="primary")
 
+# 課程 / 教師名稱自動完成 (本地索引)
+def pick_suggestion(text): st.session_state.query = text
+
+suggestions = ui_resources.suggestions(user_input) if user_input else []
+if suggestions and user_input.strip() not in suggestions:
+    for col, text in zip(st.columns(len(suggestions)), suggestions):
+        col.button(text, key=f"suggest_{text}", on_click=pick_suggestion, args=(text,), use_container_width=True)
+
 if 'analysis_result' not in st.session_state: st.session_state.analysis_result = None
 if 'judge_results' not in st.session_state: st.session_state.judge_results = None
+if 'job_id' not in st.session_state: st.session_state.job_id = None
+if 'last_job' not in st.session_state: st.session_state.last_job = None
 
 if btn_search and user_input:
     if not GEMINI_API_KEY: st.error("缺 API Key"); st.stop()
     st.session_state.analysis_result = None 
     st.session_state.judge_results = None
-    
-    with st.status("任務啟動...", expanded=True) as status:
-        update_sidebar_status("Manager", MODELS["MANAGER"])
-        intent_data = agent_manager(user_input)
-        intent = intent_data.get("intent", "recommend")
-        keywords = intent_data.get("keywords", user_input)
-        st.success(f"意圖：**{intent}** (目標：`{keywords}`)")
-        
-        if intent == "analyze":
-            update_sidebar_status("Search Engine", "Hybrid")
-            st.write(f"**Search**: 廣域搜尋中...")
-            raw_data = search_hybrid(keywords, mode="analysis")
-            if not raw_data: st.stop()
-            
-            with st.expander(f"原始搜尋資料 ({len(raw_data)} 筆)", expanded=False):
-                for item in raw_data:
-                    st.text(item)
-                    st.divider()
-
-            update_sidebar_status("Cleaner", MODELS["CLEANER"])
-            st.write("**Cleaner**: 資料摘要中...")
-            curated = agent_cleaner(keywords, raw_data)
-            with st.expander("資料摘要", expanded=False): st.markdown(curated)
-
-            st.write("**Panel Judges**: 四方會談 (Gemma vs Gemini)...")
-            update_sidebar_status("Judges (x4)", "Multi-Model")
-            panel_res = agent_judge_panel(keywords, curated)
-            st.session_state.judge_results = panel_res
-            
-            with st.expander("查看四位評審意見", expanded=False):
-                c_a, c_b = st.columns(2)
-                with c_a:
-                    st.markdown("###嚴格學術派")
-                    st.info(f"**Gemma 3**: {panel_res['A_Gemma']['score']}分\n{panel_res['A_Gemma']['comment']}")
-                    st.info(f"**Gemini 2.5**: {panel_res['A_Gemini']['score']}分\n{panel_res['A_Gemini']['comment']}")
-                with c_b:
-                    st.markdown("###甜涼快樂派")
-                    st.warning(f"**Gemma 3**: {panel_res['B_Gemma']['score']}分\n{panel_res['B_Gemma']['comment']}")
-                    st.warning(f"**Gemini 2.5**: {panel_res['B_Gemini']['score']}分\n{panel_res['B_Gemini']['comment']}")
-
-            update_sidebar_status("Synthesizer", MODELS["SYNTHESIZER"])
-            st.write("**Synthesizer**: 正在統整最終判決...")
-            final_raw = agent_synthesizer(keywords, panel_res)
-            final_data = agent_fixer(final_raw)
-            
-            if final_data:
-                st.session_state.analysis_result = final_data
-                update_sidebar_status("Illustrator", "Local")
-                st.write("**Illustrator**: 更新三張榜單...")
-                
-                update_tier_list_image("A", user_input, panel_res['A_Gemini'].get('tier', 'C'), lang=CURRENT_LANG)
-                update_tier_list_image("B", user_input, panel_res['B_Gemini'].get('tier', 'C'), lang=CURRENT_LANG)
-                update_tier_list_image("Total", user_input, final_data.get('tier', 'C'), lang=CURRENT_LANG)
-                
-                status.update(label="評審完成！", state="complete")
-                update_sidebar_status("System", "Ready", "idle")
-            else:
-                status.update(label="綜合分析失敗", state="error")
-        else:
-            # === 推薦模式 (Hunter Mode) ===
-            
-            # 1. 搜尋 (Search) - 由 search_hybrid 負責
-            update_sidebar_status("Search Engine", "Hybrid")
-            st.write("**Hunter**: 搜尋熱門課程...")
-            raw_data = search_hybrid(keywords, mode="recommend")
-            
-            # 顯示原始搜尋結果 (小字體)
-            with st.expander(" 原始搜尋結果", expanded=False):
-                for item in raw_data:
-                    st.text(item)
-                    st.divider()
-            
-            # 2. 整理 (Cleaner) - 由 agent_cleaner 負責
-            update_sidebar_status("Cleaner", MODELS["CLEANER"])
-            st.write("**Cleaner**: 正在過濾雜訊...")
-            curated_data = agent_cleaner(keywords, raw_data)
-            
-            # (選擇性) 顯示清理後的資料摘要，讓使用者知道 Cleaner 做了什麼
-            with st.expander(" 資料摘要 (已過濾)", expanded=False):
-                st.markdown(curated_data)
-            
-            # 3. 推薦 (Hunter) - 接收清理後的資料
-            update_sidebar_status("Hunter", MODELS["HUNTER"])
-            st.write("**Hunter**: 正在撰寫推薦報告...")
-            
-            # 關鍵：將 curated_data (乾淨資料) 餵給 Hunter
-            res = agent_hunter(keywords, curated_data)
-            
-            st.markdown(res)
-            
-            status.update(label="推薦完成", state="complete")
-            update_sidebar_status("System", "Ready", "idle")
+    st.session_state.last_job = None
+    # 分析在背景工作中執行：rerun 或關閉頁面都不會中斷，同一課程進行中的查詢會合併
+    st.session_state.job_id = pipeline.submit_query(user_input, lang=CURRENT_LANG, owner=st.session_state.session_id,
+                                                    keys=CREDENTIALS)
+
+JOB_POLL = 0.5   # 進度輪詢間隔 (秒)
+STAGE_LABELS = {
+    "manager": ("Manager", "判斷意圖中..."),
+    "search": ("Search", "廣域搜尋中..."),
+    "clean": ("Cleaner", "資料摘要中..."),
+    "judges": ("Panel Judges", "四方會談 (Gemma vs Gemini)..."),
+    "verdict": ("Illustrator", "更新三張榜單..."),
+    "prose": ("Synthesizer", "撰寫總結評語..."),
+    "hunter": ("Hunter", "正在撰寫推薦報告..."),
+}
+ERROR_LABELS = {"no_search_results": "找不到相關搜尋結果", "synthesis_failed": "綜合分析失敗"}
+
+def show_job_details(job):
+    """意圖、搜尋資料、摘要與評審意見；進行中與完成後共用"""
+    info = job["info"]
+    if info.get("intent"): st.success(f"意圖：**{info['intent']}** (目標：`{info['keywords']}`)")
+    if info.get("raw"):
+        with st.expander(f"原始搜尋資料 ({len(info['raw'])} 筆)", expanded=False):
+            for item in info["raw"]:
+                st.text(item)
+                st.divider()
+    if info.get("pack"):
+        pack_stats = info["pack"]
+        st.caption(f"資料摘要 (去除重複 {pack_stats['deduped']} 筆，送出 {pack_stats['packed']} 筆 / 約 {pack_stats['tokens']} tokens)")
+    if info.get("curated"):
+        with st.expander("Cleaner 整理後的資料", expanded=False): st.markdown(info["curated"])
+    panel_res = info.get("panel")
+    if panel_res:
+        with st.expander("查看四位評審意見", expanded=False):
+            c_a, c_b = st.columns(2)
+            with c_a:
+                st.markdown("###嚴格學術派")
+                st.info(f"**Gemma 3**: {format_judge(panel_res['A_Gemma'])}")
+                st.info(f"**Gemini 2.5**: {format_judge(panel_res['A_Gemini'])}")
+            with c_b:
+                st.markdown("###甜涼快樂派")
+                st.warning(f"**Gemma 3**: {format_judge(panel_res['B_Gemma'])}")
+                st.warning(f"**Gemini 2.5**: {format_judge(panel_res['B_Gemini'])}")
+    if info.get("verdict"):
+        st.write(f"**Synthesizer**: 綜合 {info['verdict']['score']} 分 (Tier {info['verdict']['tier']})")
+
+@st.fragment(run_every=JOB_POLL)
+def job_progress():
+    """輪詢背景工作；只重跑這個區塊，完成後才整頁 rerun 顯示結果"""
+    job = pipeline.job_manager().get(st.session_state.job_id)
+    if job is None:
+        st.session_state.job_id = None
+        st.rerun()
+    if job["status"] in ("queued", "running"):
+        if job["status"] == "queued": label = f"排隊中 (前面還有 {job['queue_position']} 個分析)..."
+        else: label = f"{STAGE_LABELS.get(job['stage'], ('任務啟動', ''))[0]} 工作中... ({job['elapsed']:.0f}s)"
+        with st.status(label, expanded=True):
+            for s in job["stages"]:
+                name, text = STAGE_LABELS.get(s["stage"], (s["stage"], ""))
+                st.write(f"**{name}**: {text}")
+            show_job_details(job)
+            if job["text"]:
+                with st.container(height=300): st.markdown(job["text"])
+        return
+    result = job["result"] or {}
+    st.session_state.job_id = None
+    st.session_state.last_job = job
+    st.session_state.judge_results = result.get("panel")
+    st.session_state.analysis_result = result.get("verdict")
+    if result.get("trace"): st.session_state.last_trace = result["trace"]
+    ui_resources.boards_changed()
+    st.rerun()
+
+if st.session_state.job_id:
+    update_sidebar_status("Job", f"#{st.session_state.job_id}")
+    job_progress()
+elif st.session_state.last_job:
+    job = st.session_state.last_job
+    result = job["result"] or {}
+    error = job["error"] or ERROR_LABELS.get(result.get("error"), result.get("error"))
+    done_label = "評審完成！" if result.get("intent") == "analyze" else "推薦完成"
+    # 已完成的工作改用 expander：st.status 每次建立都會 sleep 50ms，讓每次 rerun 都變慢
+    with st.expander(error or done_label, icon="❌" if error else "✅", expanded=False):
+        show_job_details(job)
+    if job["info"].get("cached_age") is not None:
+        c_note, c_btn = st.columns([4, 1], vertical_alignment="center")
+        minutes = job["info"]["cached_age"] // 60
+        c_note.caption(f"使用 {minutes // 60} 小時 {minutes % 60} 分前的分析結果" + (" · 背景更新中" if job["info"]["refreshing"] else ""))
+        if c_btn.button("重新分析", use_container_width=True):
+            pipeline.invalidate_verdict(job["query"])
+            st.session_state.analysis_result = None
+            st.session_state.judge_results = None
+            st.session_state.last_job = None
+            st.session_state.job_id = pipeline.submit_query(job["query"], lang=CURRENT_LANG, owner=st.session_state.session_id,
+                                                            keys=CREDENTIALS, fresh=True)
+            st.rerun()
+    if result.get("report"): st.markdown(result["report"])
 
 # ==========================================
 # 6. 結果顯示區
@@ -479,12 +247,11 @@ if st.session_state.analysis_result:
         tab_total, tab_a, tab_b = st.tabs(["綜合榜單", "嚴格派榜單", "甜涼派榜單"])
         
         def show_tier_img(l_type):
-            fname = get_tier_filename(l_type, CURRENT_LANG)
-            path = os.path.join(BASE_DIR, fname)
-            if os.path.exists(path):
-                st.image(path, use_column_width=True)
+            png = ui_resources.board_image(l_type, CURRENT_LANG)
+            if png:
+                st.image(png, use_column_width=True)
             else:
-                st.image(BASE_IMAGE_PATH, caption="尚無資料", use_column_width=True)
+                st.image(ui_resources.base_image(CURRENT_LANG), caption="尚無資料", use_column_width=True)
         
         with tab_total:
             st.caption("Synthesizer 綜合決策")
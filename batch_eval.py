@@ -0,0 +1,120 @@
+"""
+批次評價整份課程清單 (不需 Streamlit)
+
+    python batch_eval.py courses.csv -o results.jsonl -w 4 --boards boards/
+    python batch_eval.py --warm 20        # 預熱最常被查詢的課程
+
+輸入為 CSV (query 欄位或第一欄) 或 JSONL ({"query": "課程 老師"})。
+每完成一筆即寫入輸出 JSONL；重跑時會略過已成功的查詢，失敗者重試。
+全部完成後才依結果一次繪製三張榜單。
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pipeline
+import tracing
+from tier_board import TierBoard
+
+def load_queries(path):
+    queries = []
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip(): queries.append(json.loads(line)["query"])
+        else:
+            rows = list(csv.reader(f))
+            if rows and rows[0] and rows[0][0].strip().lower() == "query": rows = rows[1:]
+            queries = [r[0] for r in rows if r and r[0].strip()]
+    # 去除重複並保留順序
+    return list(dict.fromkeys(q.strip() for q in queries))
+
+def load_checkpoint(out_path):
+    """讀取既有輸出，同一查詢以最後一行為準"""
+    done = {}
+    if os.path.exists(out_path):
+        with open(out_path, encoding="utf-8") as f:
+            for line in f:
+                try: rec = json.loads(line)
+                except json.JSONDecodeError: continue   # 中斷時寫到一半的行
+                done[rec["query"]] = rec
+    return done
+
+def render_boards(results, out_dir, lang="zh"):
+    os.makedirs(out_dir, exist_ok=True)
+    boards = {l_type: TierBoard(pipeline.base_image_path(lang)) for l_type in ("A", "B", "Total")}
+    for rec in results:
+        for l_type, tier in pipeline.board_placements(rec):
+            boards[l_type].add(rec["query"], tier)
+    paths = []
+    for l_type, board in boards.items():
+        path = os.path.join(out_dir, pipeline.get_tier_filename(l_type, lang))
+        with open(path, "wb") as f: f.write(board.encode())
+        paths.append(path)
+    return paths
+
+def run_batch(queries, out_path, workers=4, on_result=None):
+    done = load_checkpoint(out_path)
+    todo = [q for q in queries if q not in done or done[q].get("error")]
+    lock = threading.Lock()
+
+    def work(q):
+        try:
+            with tracing.trace(q, pipeline.SETTINGS["TRACE_LOG"]): return pipeline.run_query(q)
+        except Exception as e: return {"query": q, "error": f"{type(e).__name__}: {e}"}
+
+    with open(out_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        for fut in as_completed([pool.submit(work, q) for q in todo]):
+            rec = fut.result()
+            with lock:
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                out.flush()
+                done[rec["query"]] = rec
+            if on_result: on_result(rec, len(done), len(queries))
+    return [done[q] for q in queries if q in done]
+
+def warm_up(limit):
+    """經背景工作預熱分析結果庫，等全部完成後回報"""
+    manager = pipeline.job_manager()
+    job_ids = pipeline.warm_up(limit)
+    failed = 0
+    for job_id in job_ids:
+        while (job := manager.get(job_id))["status"] in ("queued", "running"): time.sleep(0.5)
+        error = job["error"] or (job["result"] or {}).get("error")
+        failed += bool(error)
+        print(f"{job['query']}: {error or 'ok'}", flush=True)
+    print(f"預熱 {len(job_ids) - failed}/{len(job_ids)} 門課")
+    return 1 if failed else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批次評價課程清單")
+    parser.add_argument("input", nargs="?", help="CSV 或 JSONL，每筆一個「課程 老師」查詢")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="結果 JSONL (兼作續跑檢查點)")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="同時處理的查詢數")
+    parser.add_argument("--boards", default="batch_boards", help="榜單圖片輸出目錄")
+    parser.add_argument("--lang", choices=("zh", "en"), default="zh")
+    parser.add_argument("--warm", type=int, metavar="N", help="改為預熱：重新分析查詢次數最多、結果不存在或已過時的 N 門課")
+    args = parser.parse_args(argv)
+
+    pipeline.configure()
+    if not pipeline.SETTINGS["GEMINI_API_KEY"]: parser.error("缺少 GEMINI_API_KEY 環境變數")
+    if args.warm: return warm_up(args.warm)
+    if not args.input: parser.error("需要輸入檔 (或使用 --warm)")
+
+    queries = load_queries(args.input)
+    def report(rec, n_done, total):
+        status = rec.get("error") or (rec.get("verdict") or {}).get("tier") or rec.get("intent")
+        print(f"[{n_done}/{total}] {rec['query']}: {status}", flush=True)
+
+    results = run_batch(queries, args.output, workers=args.workers, on_result=report)
+    failed = sum(1 for r in results if r.get("error"))
+    for path in render_boards(results, args.boards, args.lang): print(f"榜單：{path}")
+    print(f"完成 {len(results) - failed}/{len(queries)}，失敗 {failed}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,326 @@
+"""
+離線效能基準 (不連網、不需 Streamlit)
+
+    python bench.py --queries 20 --concurrency 1 4 8 --llm-latency 0.3 --error-rate 0.05
+
+以行程內的假 Gemini / Google Custom Search / Tavily 取代真實 API，可調整延遲與錯誤率。
+輸出端到端與各階段延遲、N 個並行查詢下的吞吐量，以及卡片與榜單的繪製時間。
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import model_profile
+import pipeline
+import search_providers
+import tier_board
+import tracing
+from llm_cache import ModelPool
+from scheduler import ModelScheduler
+
+BASE_IMAGE_PATH = pipeline.base_image_path("zh")
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# 冷啟動與 rerun 延遲預算 (秒)；--ui 時逐項檢查，純 UI rerun 也不得有任何 I/O
+UI_BUDGET = {"import": 0.5, "first_run": 2.0, "rerun_p95": 0.15}
+
+# ==========================================
+# 假 API
+# ==========================================
+class FakeAPIError(Exception):
+    def __init__(self, code):
+        super().__init__(f"{code} injected error")
+        self.code = code
+
+class Latency:
+    """mean 秒 ± jitter 比例的延遲，並以 error_rate 機率丟出 429/503"""
+
+    def __init__(self, mean, jitter=0.3, error_rate=0.0, seed=0):
+        self.mean, self.jitter, self.error_rate = mean, jitter, error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            delay = max(0.0, self.mean * (1 + self._rng.uniform(-self.jitter, self.jitter)))
+            fail = self._rng.random() < self.error_rate
+            code = self._rng.choice((429, 503))
+        time.sleep(delay)
+        if fail: raise FakeAPIError(code)
+
+def fake_reply(prompt):
+    """依 prompt 內容回傳各 agent 形狀合理的輸出"""
+    if "判斷意圖" in prompt:
+        # 與真實 prompt 的約定相同：分析模式 keywords 只有老師名 (bench 查詢皆為「課程 老師」)
+        parts = prompt.split("「", 1)[1].split("」", 1)[0].split()
+        if len(parts) > 1: return json.dumps({"intent": "analyze", "keywords": parts[-1], "reason": "bench"}, ensure_ascii=False)
+        return json.dumps({"intent": "recommend", "keywords": " ".join(parts), "reason": "bench"}, ensure_ascii=False)
+    if "Tier (S/A/B/C/D)" in prompt:
+        return '```json\n{"tier": "A", "score": 86, "comment": "內容紮實"}\n```'
+    if "最終決策長" in prompt:
+        return json.dumps({"rank": "穩健好課", "reason": "bench", "tags": ["bench"], "details": "bench"}, ensure_ascii=False)
+    if prompt.startswith("Extract valid JSON"):
+        return prompt.split("\n", 1)[1]
+    if "選課獵頭" in prompt:
+        return "| 課程 | 老師 | 推薦指數 | 核心推薦理由 |\n|---|---|---|---|\n| 物理 | 王 | ★★★★☆ | bench |\n"
+    return "【來源】：[bench](https://example.com)\n【內文】：" + "課程心得 " * 80
+
+class FakeGenerativeModel:
+    def __init__(self, name, latency):
+        self.name, self.latency = name, latency
+
+    def generate_content(self, contents, stream=False, generation_config=None, request_options=None):
+        self.latency.wait()
+        text = fake_reply(str(contents))
+        usage = types.SimpleNamespace(prompt_token_count=len(str(contents)) // 2,
+                                      candidates_token_count=len(text) // 2,
+                                      total_token_count=(len(str(contents)) + len(text)) // 2)
+        if not stream: return types.SimpleNamespace(text=text, usage_metadata=usage)
+        size = max(1, len(text) // 8)
+        return [types.SimpleNamespace(text=text[i:i + size], usage_metadata=usage) for i in range(0, len(text), size)]
+
+class FakeSession:
+    """取代 Google Custom Search 用的 requests.Session"""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def get(self, url, params=None, timeout=None):
+        self.latency.wait()
+        q = params.get("q", "")
+        items = [{"title": f"{q} 心得 {i}", "snippet": f"{q} 的課程評價 {i}", "link": f"https://www.dcard.tw/f/ntut/p/{abs(hash((q, i)))}"}
+                 for i in range(params.get("num", 5))]
+        return types.SimpleNamespace(status_code=200, json=lambda: {"items": items})
+
+class FakeTavilyClient:
+    latency = None
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+
+    def search(self, query, max_results=5, **kwargs):
+        self.latency.wait()
+        return {"results": [{"title": f"{query} {i}", "content": f"{query} 評價內容 {i} " * 10,
+                             "url": f"https://www.ptt.cc/bbs/NTUT/{abs(hash((query, i)))}.html"}
+                            for i in range(max_results)]}
+
+def install_fakes(llm_latency, search_latency, error_rate, seed=0, real_limits=False):
+    """將 pipeline 的外部依賴換成假物件；快取與追蹤檔寫到暫存目錄"""
+    llm = Latency(llm_latency, error_rate=error_rate, seed=seed)
+    search = Latency(search_latency, error_rate=error_rate, seed=seed + 1)
+    pipeline.MODEL_POOL = ModelPool(lambda name, api_key=None: FakeGenerativeModel(name, llm))
+    if not real_limits:
+        pipeline.SCHEDULER = ModelScheduler({}, default_limit={"rpm": 10 ** 6, "tpm": 10 ** 9, "concurrency": 64},
+                                            base_backoff=0.05, max_backoff=0.5)
+    search_providers._SESSION = FakeSession(search)
+    FakeTavilyClient.latency = search
+    search_providers.TavilyClient = FakeTavilyClient
+    search_providers.get_tavily_client.cache_clear()
+    pipeline.BASE_DIR = tempfile.mkdtemp(prefix="ntut-bench-")
+    fake_env = {"GEMINI_API_KEY": "bench", "GOOGLE_SEARCH_API_KEY": "bench", "SEARCH_ENGINE_ID": "bench",
+                "TAVILY_API_KEY": "bench", "TRACE_LOG": ""}
+    pipeline.configure(fake_env.get)
+
+# ==========================================
+# 量測
+# ==========================================
+def pct(values, p):
+    if not values: return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def describe(values):
+    return {"n": len(values), "p50": round(pct(values, 50), 4), "p95": round(pct(values, 95), 4),
+            "mean": round(statistics.fmean(values), 4) if values else 0.0}
+
+_run_id = iter(range(10 ** 9))
+
+def make_queries(n, tag):
+    # 每輪的課程與老師都不同：分析模式只以老師名搜尋 / 評分，老師重複會命中前一輪的搜尋 / LLM 快取
+    return [f"課程{tag}{i}-{rid} 老師{tag}{i}-{rid}" for i, rid in zip(range(n), _run_id)]
+
+def run_one(query):
+    with tracing.trace(query) as tr:
+        start = time.perf_counter()
+        result = pipeline.run_query(query)
+        elapsed = time.perf_counter() - start
+    return result, elapsed, tr.to_dict()
+
+def bench_pipeline(n_queries, concurrency):
+    queries = make_queries(n_queries, f"c{concurrency}")
+    latencies, stages, errors = [], {}, 0
+    spec_before = pipeline.speculation_stats()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for result, elapsed, tr in pool.map(run_one, queries):
+            latencies.append(elapsed)
+            errors += bool(result.get("error"))
+            for s in tr["spans"]: stages.setdefault(s["name"], []).append(s["duration"])
+    wall = time.perf_counter() - start
+    return {"concurrency": concurrency, "queries": n_queries, "errors": errors,
+            "speculation": {k: pipeline.speculation_stats()[k] - spec_before[k] for k in ("hits", "misses", "cancelled")},
+            "throughput_qps": round(n_queries / wall, 3), "end_to_end": describe(latencies),
+            "stages": {name: describe(v) for name, v in stages.items()}}
+
+def bench_render(n_cards=60):
+    names = [f"課程{i} 老師{i}" for i in range(n_cards)]
+    tier_board.create_course_card.cache_clear()
+    tier_board.fit_font.cache_clear()
+    cold, warm = [], []
+    for name in names:
+        t = time.perf_counter(); tier_board.create_course_card(name, (170, 170)); cold.append(time.perf_counter() - t)
+    for name in names:
+        t = time.perf_counter(); tier_board.create_course_card(name, (170, 170)); warm.append(time.perf_counter() - t)
+    board = tier_board.TierBoard(BASE_IMAGE_PATH)
+    for i, name in enumerate(names): board.add(name, tier_board.TIERS[i % 5])
+    t = time.perf_counter(); board.render(); render = time.perf_counter() - t
+    t = time.perf_counter(); board.encode(); encode = time.perf_counter() - t
+    t = time.perf_counter(); board.encode(); cached = time.perf_counter() - t
+    return {"card_cold": describe(cold), "card_warm": describe(warm),
+            "board_render_s": round(render, 4), "board_encode_s": round(encode, 4), "board_cached_s": round(cached, 6)}
+
+def cold_import_time(module="pipeline"):
+    """新行程匯入 module 的時間 (不含直譯器本身啟動)"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-W", "ignore", "-c", code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(APP_PATH))
+    return float(out.stdout.split()[-1])
+
+class IOCounter:
+    """以 audit hook 計算專案 / 資料目錄下的檔案開啟與網路連線，另以 trace callback 計算 SQLite 查詢。
+    Streamlit 每次 rerun 自行讀取的 app.py 不計"""
+
+    def __init__(self, roots):
+        self.roots, self.counts, self.active = tuple(roots), {}, False
+        sys.addaudithook(self._hook)
+
+    def _bump(self, name):
+        if self.active: self.counts[name] = self.counts.get(name, 0) + 1
+
+    def _hook(self, event, args):
+        if event == "open" and isinstance(args[0], str) and args[0].startswith(self.roots) and args[0] != APP_PATH:
+            self._bump("open")
+        elif event == "socket.connect": self._bump("socket")
+
+    def watch_sqlite(self, conn):
+        conn.set_trace_callback(lambda sql: self._bump("sqlite"))
+
+def bench_ui(reruns=20):
+    """以 AppTest 跑 app.py：首次執行、一次完整查詢後，量測切換語言等純 UI rerun 的延遲與 I/O"""
+    from streamlit.testing.v1 import AppTest
+    counter = IOCounter([os.path.dirname(APP_PATH), pipeline.BASE_DIR])
+    counter.watch_sqlite(pipeline.search_cache()._conn)
+    counter.watch_sqlite(pipeline.board_store()._conn)
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.secrets["GEMINI_API_KEY"] = "bench"
+    t = time.perf_counter(); at.run(); first_run = time.perf_counter() - t
+    at.text_input(key="query").set_value("物理 施坤龍")
+    next(b for b in at.button if b.label == "智能搜尋").click()
+    t = time.perf_counter()
+    at.run()
+    while at.session_state.job_id:   # 背景工作完成前持續輪詢
+        time.sleep(0.05)
+        at.run()
+    query_run = time.perf_counter() - t
+
+    langs = ["英文", "中文"]
+    for lang in langs: at.radio[0].set_value(lang).run()   # 兩種語言各繪製一次
+    counter.active, times = True, []
+    for i in range(reruns):
+        at.radio[0].set_value(langs[i % 2])
+        t = time.perf_counter(); at.run(); times.append(time.perf_counter() - t)
+    counter.active = False
+    result = {"import": round(cold_import_time(), 4), "first_run": round(first_run, 4), "query_run": round(query_run, 4),
+              "rerun": describe(times), "rerun_io": counter.counts, "exception": bool(at.exception)}
+    result["budget"] = {"import": result["import"] <= UI_BUDGET["import"],
+                        "first_run": first_run <= UI_BUDGET["first_run"],
+                        "rerun_p95": result["rerun"]["p95"] <= UI_BUDGET["rerun_p95"],
+                        "rerun_io": not counter.counts}
+    return result
+
+# 假模型清單：名稱 → 相對於 --llm-latency 的延遲倍數 (None 表示不支援 generateContent)
+FAKE_MODELS = {"models/gemini-2.5-flash": 1.0, "models/gemini-2.5-flash-lite": 0.5, "models/gemini-2.0-flash": 0.7,
+               "models/gemma-3-27b-it": 1.5, "models/gemma-3-12b-it": 0.8, "models/text-embedding-004": None}
+# 較小的模型在長文字角色上偷懶：Cleaner 改寫成摘要、Hunter 不給表格 (探測的格式檢查應淘汰它們)
+LOSSY_MODELS = {"models/gemini-2.5-flash-lite", "models/gemma-3-12b-it"}
+
+class LossyFakeModel(FakeGenerativeModel):
+    def generate_content(self, contents, stream=False, generation_config=None, request_options=None):
+        if "過濾雜訊" in str(contents) or "選課獵頭" in str(contents):
+            self.latency.wait()
+            return types.SimpleNamespace(text="這門課整體評價不錯，作業固定、考試偏難。", usage_metadata=None)
+        return super().generate_content(contents, stream, generation_config, request_options)
+
+def bench_probe(llm_latency, error_rate=0.0, seed=0, runs=3):
+    """以假模型清單跑 check_models 的延遲探測與各角色選模"""
+    listing = [types.SimpleNamespace(name=name, supported_generation_methods=["embedContent"] if factor is None else ["generateContent"])
+               for name, factor in FAKE_MODELS.items()]
+    latencies = {name: Latency(llm_latency * (factor or 1), error_rate=error_rate, seed=seed + i)
+                 for i, (name, factor) in enumerate(FAKE_MODELS.items())}
+    def factory(name):
+        return (LossyFakeModel if name in LOSSY_MODELS else FakeGenerativeModel)(name, latencies[name])
+    profile = model_profile.probe(lambda: listing, factory, runs=runs)
+    chosen, reasons = model_profile.select_models(profile, pipeline.DEFAULT_MODELS)
+    return {"profile": profile, "models": chosen, "reasons": reasons}
+
+def print_report(report):
+    for run in report["pipeline"]:
+        e2e = run["end_to_end"]
+        print(f"\n== concurrency {run['concurrency']}: {run['queries']} queries, {run['throughput_qps']} q/s, "
+              f"errors {run['errors']} | e2e p50 {e2e['p50']}s p95 {e2e['p95']}s | "
+              f"speculation hit {run['speculation']['hits']} / miss {run['speculation']['misses']}")
+        for name, d in sorted(run["stages"].items(), key=lambda kv: -kv[1]["p50"]):
+            print(f"   {name:<16} n={d['n']:<4} p50 {d['p50']:.4f}s  p95 {d['p95']:.4f}s")
+    r = report["render"]
+    print(f"\n== render: card cold p50 {r['card_cold']['p50'] * 1000:.2f}ms, warm p50 {r['card_warm']['p50'] * 1e6:.1f}µs, "
+          f"board render {r['board_render_s'] * 1000:.1f}ms, encode {r['board_encode_s'] * 1000:.1f}ms, "
+          f"cached encode {r['board_cached_s'] * 1e6:.1f}µs")
+    if "ui" in report:
+        u = report["ui"]
+        print(f"\n== ui: import pipeline {u['import']}s, first run {u['first_run']}s, query {u['query_run']}s, "
+              f"rerun p50 {u['rerun']['p50'] * 1000:.1f}ms p95 {u['rerun']['p95'] * 1000:.1f}ms, rerun I/O {u['rerun_io'] or 'none'}")
+        print("   budget " + ", ".join(f"{k} {'ok' if ok else 'OVER'}" for k, ok in u["budget"].items()))
+    if "probe" in report:
+        p = report["probe"]
+        print(f"\n== model probe: {len(p['profile']['models'])} models × {len(model_profile.ROLE_PROBES)} roles")
+        for role, model in p["models"].items():
+            print(f"   {role:<16} {model:<32} {p['reasons'].get(role, 'default')}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="離線效能基準")
+    parser.add_argument("--queries", type=int, default=12, help="每種並行度跑的查詢數")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="假模型平均延遲 (秒)")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="假搜尋 API 平均延遲 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="每次 API 呼叫注入 429/503 的機率")
+    parser.add_argument("--real-limits", action="store_true", help="使用 pipeline 的真實 RPM/TPM 限制")
+    parser.add_argument("--cards", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ui", action="store_true", help="另以 AppTest 量測冷啟動與 rerun 延遲預算")
+    parser.add_argument("--probe", action="store_true", help="另以假模型清單跑延遲探測與選模")
+    parser.add_argument("--json", help="另將完整結果寫入此 JSON 檔")
+    args = parser.parse_args(argv)
+
+    install_fakes(args.llm_latency, args.search_latency, args.error_rate, args.seed, args.real_limits)
+    report = {"config": vars(args),
+              "pipeline": [bench_pipeline(args.queries, c) for c in args.concurrency],
+              "render": bench_render(args.cards)}
+    if args.ui: report["ui"] = bench_ui()
+    if args.probe: report["probe"] = bench_probe(args.llm_latency, args.error_rate, args.seed)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if args.ui and not all(report["ui"]["budget"].values()) else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,95 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+# ==========================================
+# 榜單資料庫 (SQLite WAL)：所有 session / 行程共用，每張榜單一個版本號
+# ==========================================
+class BoardStore:
+    """新增與刪除都在單一交易內完成並遞增該榜單版本，讀取者以版本號判斷是否需要重繪"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._tx():
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS board_entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                board TEXT, tier TEXT, name TEXT, owner TEXT, created REAL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS board_entries_board ON board_entries (board, id)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS board_versions (board TEXT PRIMARY KEY, version INTEGER)")
+
+    @contextmanager
+    def _tx(self):
+        """BEGIN IMMEDIATE：寫入者先取得鎖，避免多行程同時讀後寫"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _bump(self, boards):
+        for board in boards:
+            self._conn.execute("""INSERT INTO board_versions VALUES (?, 1)
+                ON CONFLICT (board) DO UPDATE SET version = version + 1""", (board,))
+
+    def add(self, board, name, tier, owner=None):
+        """每張榜單同一課程只有一張卡片：已在同一 tier 時不變 (版本不動)，在其他 tier 時移過去並保留原加入者。
+        回傳是否有變更"""
+        with self._lock, self._tx():
+            row = self._conn.execute("SELECT id, tier FROM board_entries WHERE board = ? AND name = ? ORDER BY id LIMIT 1",
+                                     (board, name)).fetchone()
+            if row and row[1] == tier: return False
+            if row: self._conn.execute("UPDATE board_entries SET tier = ? WHERE id = ?", (tier, row[0]))
+            else:
+                self._conn.execute("INSERT INTO board_entries (board, tier, name, owner, created) VALUES (?, ?, ?, ?, ?)",
+                                   (board, tier, name, owner, time.time()))
+            self._bump([board])
+        return True
+
+    def version(self, board):
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM board_versions WHERE board = ?", (board,)).fetchone()
+        return row[0] if row else 0
+
+    def versions(self):
+        """所有榜單的版本號，一次查詢"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT board, version FROM board_versions").fetchall())
+
+    def entries(self, board):
+        """(版本, [(tier, name), ...])，同一個讀取交易內取得，兩者必定一致"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                row = self._conn.execute("SELECT version FROM board_versions WHERE board = ?", (board,)).fetchone()
+                rows = self._conn.execute("SELECT tier, name FROM board_entries WHERE board = ? ORDER BY id",
+                                          (board,)).fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+        return (row[0] if row else 0), rows
+
+    def remove_owner(self, owner):
+        """只移除某個 session 加入的卡片；回傳受影響的榜單"""
+        with self._lock, self._tx():
+            boards = [r[0] for r in self._conn.execute(
+                "SELECT DISTINCT board FROM board_entries WHERE owner = ?", (owner,)).fetchall()]
+            self._conn.execute("DELETE FROM board_entries WHERE owner = ?", (owner,))
+            self._bump(boards)
+        return boards
+
+    def clear(self, board):
+        with self._lock, self._tx():
+            self._conn.execute("DELETE FROM board_entries WHERE board = ?", (board,))
+            self._bump([board])
+
+@lru_cache(maxsize=None)
+def get_board_store(path):
+    """行程內共用同一個連線，Streamlit rerun 不會重開"""
+    return BoardStore(path)
@@ -1,6 +1,9 @@
 import streamlit as st
 import google.generativeai as genai
-import os
+
+import pipeline
+import ui_resources
+from model_profile import ROLE_PROBES, probe, save_profile, select_models, text_models
 
 st.title("🕵️‍♂️ Gemini 模型偵測器")
 
@@ -47,3 +50,51 @@ if st.button("開始列出模型 (List Models)"):
     except Exception as e:
         st.error(f"❌ 查詢失敗: {e}")
         st.write("這代表你的 google-generativeai 套件版本可能還是舊的，或者網路/Key有問題。")
+
+# ==========================================
+# 延遲探測：量測各模型在每個角色的延遲 / 錯誤率 / 輸出合格率，寫入設定檔供 app.py 選模
+# ==========================================
+@st.cache_data(ttl=600, show_spinner=False)
+def list_text_models(api_key):
+    """list_models 需連網，滑桿 / 多選的 rerun 不重複查詢"""
+    genai.configure(api_key=api_key)
+    return text_models(genai.list_models)
+
+# 與 app.py 相同的設定來源 (secrets / 環境變數)，設定檔路徑與門檻才會一致
+SETTINGS = pipeline.configure(ui_resources.secret_config().get)
+
+st.divider()
+st.header("⏱️ 各角色延遲探測")
+st.caption(f"結果寫入 `{SETTINGS['MODEL_PROFILE']}`，app.py 重新啟動後依此為每個角色挑選合格模型中最快者。")
+
+if api_key:
+    try: available = list_text_models(api_key)
+    except Exception as e:
+        st.error(f"❌ 查詢失敗: {e}")
+        available = []
+    # 預設只探測目前設定與 fallback 用到的模型，避免耗盡配額
+    in_use = set(pipeline.DEFAULT_MODELS.values()) | {pipeline.FALLBACK_MODEL} | {m for chain in pipeline.FALLBACK_CHAINS.values() for m in chain}
+    targets = st.multiselect("要探測的模型", available, default=[m for m in available if m in in_use])
+    runs = st.slider("每個角色呼叫次數", 1, 10, 3)
+    roles = st.multiselect("角色", list(ROLE_PROBES), default=list(ROLE_PROBES))
+
+    if st.button("開始探測") and targets and roles:
+        rows = []
+        table = st.empty()
+        bar = st.progress(0.0)
+        total = len(targets) * len(roles)
+
+        def on_result(name, role, stats):
+            rows.append({"model": name, "role": role, **stats})
+            bar.progress(len(rows) / total, text=f"{name} · {role}")
+            table.dataframe(rows, use_container_width=True)
+
+        genai.configure(api_key=api_key)
+        profile = probe(genai.list_models, genai.GenerativeModel, roles=roles, runs=runs,
+                        include=lambda name: name in targets, on_result=on_result)
+        save_profile(profile, SETTINGS["MODEL_PROFILE"])
+        chosen, reasons = select_models(profile, pipeline.DEFAULT_MODELS,
+                                        SETTINGS["MODEL_QUALITY_FLOOR"], SETTINGS["MODEL_MAX_ERROR"])
+        st.success("✅ 已寫入設定檔，各角色將使用：")
+        st.dataframe([{"role": role, "model": model, "依據": reasons.get(role, "無合格資料，沿用預設")}
+                      for role, model in chosen.items()], use_container_width=True)
@@ -0,0 +1,107 @@
+import hashlib
+import re
+import unicodedata
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# ==========================================
+# 搜尋結果前處理：URL 正規化、近似重複移除 (MinHash)、相關度排序、token 預算打包
+# ==========================================
+TRACKING_PARAMS = {"fbclid", "gclid", "ref", "ref_src", "igshid", "mc_cid", "mc_eid", "sid"}
+
+def normalize_url(url):
+    """統一大小寫、移除 www./m./追蹤參數/錨點/結尾斜線，讓同一頁面的不同寫法視為相同"""
+    try: parts = urlsplit(str(url).strip())
+    except ValueError: return str(url).strip()
+    host = parts.netloc.lower()
+    for prefix in ("www.", "m."):
+        if host.startswith(prefix): host = host[len(prefix):]
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS)
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https" if parts.scheme in ("http", "https") else parts.scheme, host, path, urlencode(query), ""))
+
+def parse_hit(text):
+    """拆解 search_hybrid 的格式：'[來源] 標題\\n內文\\nLink: 網址'"""
+    body, _, link = text.rpartition("\nLink: ")
+    if not body: body, link = text, ""
+    head, _, snippet = body.partition("\n")
+    return {"text": text, "head": head, "snippet": snippet, "link": link.strip()}
+
+def _normalize_text(text):
+    text = unicodedata.normalize("NFKC", text).lower()
+    return re.sub(r"[\W_]+", "", text)   # 去除空白與標點，中英文都以字元為單位
+
+def shingles(text, k=4):
+    t = _normalize_text(text)
+    if len(t) <= k: return {t} if t else set()
+    return {t[i:i + k] for i in range(len(t) - k + 1)}
+
+_MERSENNE = (1 << 61) - 1
+_PERMS = [(int.from_bytes(hashlib.blake2b(bytes([i]), digest_size=8).digest(), "big") | 1,
+           int.from_bytes(hashlib.blake2b(bytes([i, 255]), digest_size=8).digest(), "big"))
+          for i in range(64)]
+
+def minhash(shingle_set):
+    if not shingle_set: return None
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingle_set]
+    return [min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMS]
+
+def similarity(sig_a, sig_b):
+    if sig_a is None or sig_b is None: return 0.0
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / len(sig_a)
+
+def _terms(text):
+    """查詢詞：英數字詞 + 中文字 bigram"""
+    t = unicodedata.normalize("NFKC", text).lower()
+    terms = set(re.findall(r"[a-z0-9]+", t))
+    for run in re.findall(r"[一-鿿]+", t):
+        terms.update(run[i:i + 2] for i in range(max(1, len(run) - 1)))
+    return terms
+
+def relevance(query_terms, hit):
+    """標題命中加權、內文命中次數飽和的簡化 BM25"""
+    head, body = hit["head"].lower(), hit["snippet"].lower()
+    score = 0.0
+    for term in query_terms:
+        tf = body.count(term)
+        score += 2.0 * (term in head) + tf / (tf + 1.2)
+    return score / max(1, len(query_terms))
+
+def pack_context(query, results, budget_tokens=3000, dedupe_threshold=0.8, estimate=None):
+    """去除近似重複後依相關度排序，在 budget_tokens 內盡量放入；回傳 (保留的結果, 統計)"""
+    estimate = estimate or (lambda s: max(1, len(s) // 2))
+    hits = [parse_hit(r) for r in results]
+
+    seen_links, kept, sigs = set(), [], []
+    for hit in hits:
+        link = normalize_url(hit["link"]) if hit["link"] else None
+        if link and link in seen_links: continue
+        # 內文夠長時只比內文，避免轉貼文章因標題 / 來源標籤不同而漏判
+        basis = hit["snippet"] if len(_normalize_text(hit["snippet"])) >= 20 else re.sub(r"^\[\w+\] ", "", hit["head"]) + hit["snippet"]
+        sig = minhash(shingles(basis))
+        if any(similarity(sig, other) >= dedupe_threshold for other in sigs): continue
+        if link: seen_links.add(link)
+        kept.append(hit)
+        sigs.append(sig)
+
+    terms = _terms(query)
+    ranked = sorted(kept, key=lambda h: relevance(terms, h), reverse=True)
+
+    packed, used = [], 0
+    for hit in ranked:
+        cost = estimate(hit["text"])
+        if used + cost <= budget_tokens:
+            packed.append(hit["text"])
+            used += cost
+        elif budget_tokens - used >= 100:
+            # 剩餘預算足夠時截斷內文放入
+            room = (budget_tokens - used) * 2 - len(hit["head"]) - len(hit["link"]) - 20
+            if room > 50:
+                text = f"{hit['head']}\n{hit['snippet'][:room]}…\nLink: {hit['link']}"
+                packed.append(text)
+                used += estimate(text)
+            break
+        else:
+            break
+    stats = {"input": len(results), "deduped": len(results) - len(kept), "packed": len(packed), "tokens": used}
+    return packed, stats
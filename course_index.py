@@ -0,0 +1,137 @@
+import csv
+import json
+import os
+import unicodedata
+from functools import lru_cache
+
+# ==========================================
+# 本地課程 / 教師索引：前綴自動完成、查詢正規化、意圖快速判斷
+# ==========================================
+def normalize_name(name):
+    return "".join(unicodedata.normalize("NFKC", str(name)).lower().split())
+
+class Trie:
+    """字元 trie；每個節點的 None 鍵存放以此結尾的名稱"""
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, key, value):
+        node = self.root
+        for ch in key: node = node.setdefault(ch, {})
+        node.setdefault(None, []).append(value)
+
+    def longest_match(self, text, start):
+        """從 start 起最長的已知名稱：(結束位置, 值列表)；沒有則 (start, None)"""
+        node, end, found = self.root, start, None
+        for i in range(start, len(text)):
+            node = node.get(text[i])
+            if node is None: break
+            if None in node: end, found = i + 1, node[None]
+        return end, found
+
+    def prefixed(self, prefix, limit):
+        node = self.root
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None: return []
+        out, stack = [], [node]
+        while stack and len(out) < limit:
+            node = stack.pop()
+            out.extend(node.get(None, []))
+            # 反向壓入，讓較短 / 字典序較前的名稱先出現
+            stack.extend(node[ch] for ch in sorted((k for k in node if k is not None), reverse=True))
+        return out[:limit]
+
+class CourseIndex:
+    """課程與教師名稱各自建 trie，另以倒排索引記錄 名稱 → 開課組合 (course, teacher)"""
+
+    def __init__(self, rows=()):
+        self.pairs = []
+        self.by_name = {}
+        self.trie = Trie()
+        for course, teacher in rows: self.add(course, teacher)
+
+    def add(self, course, teacher=""):
+        course, teacher = str(course).strip(), str(teacher or "").strip()
+        if not course: return
+        pair_id = len(self.pairs)
+        self.pairs.append((course, teacher))
+        for kind, name in (("course", course), ("teacher", teacher)):
+            if not name: continue
+            key = normalize_name(name)
+            if key not in self.by_name:
+                self.by_name[key] = {"kind": set(), "name": name, "pairs": set()}
+                self.trie.insert(key, key)
+            entry = self.by_name[key]
+            entry["kind"].add(kind)
+            entry["pairs"].add(pair_id)
+
+    def kinds(self, name):
+        """名稱在索引中的種類 ({"course"} / {"teacher"} / 兩者)，不認得時為空集合"""
+        entry = self.by_name.get(normalize_name(name))
+        return entry["kind"] if entry else set()
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def tokenize(self, query):
+        """以最長匹配切出已知名稱；回傳 (名稱 key 列表, 無法辨識的片段)"""
+        text = normalize_name(query)
+        names, unknown, i = [], "", 0
+        while i < len(text):
+            end, found = self.trie.longest_match(text, i)
+            if found:
+                names.append(found[0])
+                i = end
+            else:
+                unknown += text[i]
+                i += 1
+        return names, unknown
+
+    def match(self, query):
+        """唯一對應時回傳 {"intent", "course", "teacher", "keywords", "query"}；含未知字詞或有歧義時回傳 None。
+        keywords 與 Manager 的約定相同 (分析模式只搜老師名)，query 為正規化的「課程 老師」，供快取 / 工作 key 使用"""
+        names, unknown = self.tokenize(query)
+        if unknown or not names: return None
+        courses = [n for n in names if self.by_name[n]["kind"] == {"course"}]
+        teachers = [n for n in names if self.by_name[n]["kind"] == {"teacher"}]
+        # 同名同時是課程與教師，或重複出現多個課程 / 教師，交給 LLM 判斷
+        if len(courses) + len(teachers) != len(names) or len(courses) > 1 or len(teachers) > 1: return None
+        course = self.by_name[courses[0]]["name"] if courses else ""
+        if not teachers:
+            return {"intent": "recommend", "course": course, "teacher": "", "keywords": course, "query": course}
+        teacher = self.by_name[teachers[0]]["name"]
+        if course and not any(self.pairs[p][0] == course for p in self.by_name[teachers[0]]["pairs"]): return None
+        return {"intent": "analyze", "course": course, "teacher": teacher, "keywords": teacher,
+                "query": canonical_query(course, teacher)}
+
+    def complete(self, prefix, limit=8):
+        """前綴自動完成：課程名稱後接其開課組合，教師名稱則列出其所有課程"""
+        key = normalize_name(prefix)
+        if not key: return []
+        out = []
+        for name in self.trie.prefixed(key, limit):
+            entry = self.by_name[name]
+            if "course" in entry["kind"]: out.append(entry["name"])
+            out.extend(canonical_query(*self.pairs[p]) for p in sorted(entry["pairs"]) if self.pairs[p][1])
+        return list(dict.fromkeys(out))[:limit]
+
+def canonical_query(course, teacher=""):
+    """同一組 (課程, 教師) 不論輸入順序都得到相同字串，讓搜尋 / LLM 快取能共用"""
+    return f"{course} {teacher}".strip()
+
+def load_rows(path):
+    """CSV (course,teacher 欄位) 或 JSON ([{"course": ..., "teacher": ...}])"""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.endswith(".json"):
+            return [(r.get("course", ""), r.get("teacher", "")) for r in json.load(f)]
+        return [(r.get("course", ""), r.get("teacher", "")) for r in csv.DictReader(f)]
+
+@lru_cache(maxsize=4)
+def get_course_index(path):
+    if not path or not os.path.exists(path): return CourseIndex()
+    try: return CourseIndex(load_rows(path))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Course index Error: {e}")
+        return CourseIndex()
@@ -0,0 +1,132 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+# ==========================================
+# 背景分析工作：行程內 worker pool、工作 ID、階段進度、相同查詢合併
+# ==========================================
+ACTIVE = ("queued", "running")
+
+class Job:
+    """runner 透過 progress(stage, **info) 回報進度；info["text"] 為目前階段的串流輸出。
+    subscribers：送出者與併入者各自的參數 (例如榜單語言、session)，runner 以 take_subscribers() 逐批取得"""
+
+    def __init__(self, job_id, key, query, kwargs, subscriber=None):
+        self.id, self.key, self.query, self.kwargs = job_id, key, query, kwargs
+        self.subscribers = [subscriber] if subscriber is not None else []
+        self._taken, self.closed = 0, False
+        self.status = "queued"
+        self.stage, self.stages, self.info, self.text = None, [], {}, ""
+        self.result = self.error = None
+        self.merged = 0
+        self.created, self.started, self.finished = time.time(), None, None
+        self._lock = threading.Lock()
+
+    def progress(self, stage, **info):
+        with self._lock:
+            if stage != self.stage:
+                self.stages.append({"stage": stage, "at": round(time.time() - self.started, 2)})
+                self.stage, self.text = stage, ""
+            text = info.pop("text", None)
+            if text is not None: self.text = text
+            self.info.update(info)
+
+    def join(self, subscriber):
+        """併入此工作；runner 已取走最後一批訂閱者 (即將結束) 時回傳 False"""
+        with self._lock:
+            if self.closed: return False
+            if subscriber is not None: self.subscribers.append(subscriber)
+            self.merged += 1
+            return True
+
+    def take_subscribers(self, close=False):
+        """上次呼叫後新加入的訂閱者；close=True 時之後不再接受併入"""
+        with self._lock:
+            new, self._taken = self.subscribers[self._taken:], len(self.subscribers)
+            if close: self.closed = True
+            return new
+
+    def snapshot(self):
+        with self._lock:
+            return {"id": self.id, "query": self.query, "status": self.status, "stage": self.stage,
+                    "stages": list(self.stages), "info": dict(self.info), "text": self.text,
+                    "result": self.result, "error": self.error, "merged": self.merged,
+                    "elapsed": round((self.finished or time.time()) - (self.started or self.created), 2)}
+
+class JobManager:
+    """同時最多 workers 個分析；key 相同且尚未完成的查詢併入同一個工作 (各自的 subscriber 都會保留)。
+    runner(query, progress, take_subscribers, **kwargs)；完成的工作保留最近 keep 筆供輪詢取回結果"""
+
+    def __init__(self, runner, workers=2, keep=200):
+        self.runner, self.keep = runner, keep
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.counts = {"submitted": 0, "merged": 0, "done": 0, "error": 0}
+
+    def submit(self, query, key=None, subscriber=None, **kwargs):
+        """回傳工作 ID；相同 key 的工作仍在排隊或執行時併入並回傳該工作的 ID (kwargs 以第一個送出者為準)"""
+        key = key or query
+        with self._lock:
+            self.counts["submitted"] += 1
+            job = self._active.get(key)
+            if job is not None and job.join(subscriber):
+                self.counts["merged"] += 1
+                return job.id
+            job = Job(f"{next(self._ids):06d}", key, query, kwargs, subscriber)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._evict()
+        self._pool.submit(self._run, job)
+        return job.id
+
+    def completed(self, query, result, **info):
+        """直接登記一個已完成的工作 (例如快取命中)，讓 UI 以相同的輪詢流程取得結果"""
+        with self._lock:
+            job = Job(f"{next(self._ids):06d}", query, query, {})
+            job.status, job.result, job.info = "done", result, info
+            job.started = job.finished = job.created
+            self._jobs[job.id] = job
+            self._evict()
+        return job.id
+
+    def _evict(self):
+        finished = [jid for jid, j in self._jobs.items() if j.status not in ACTIVE]
+        for jid in finished[:max(0, len(self._jobs) - self.keep)]: del self._jobs[jid]
+
+    def _run(self, job):
+        with job._lock: job.status, job.started = "running", time.time()
+        try:
+            result, error, status = self.runner(job.query, job.progress, job.take_subscribers, **job.kwargs), None, "done"
+        except Exception as e:
+            result, error, status = None, f"{type(e).__name__}: {e}", "error"
+        with self._lock:
+            with job._lock: job.result, job.error, job.status, job.finished = result, error, status, time.time()
+            if self._active.get(job.key) is job: del self._active[job.key]
+            self.counts[status] += 1
+
+    def get(self, job_id):
+        """工作快照 (含排隊位置)；ID 不存在或已淘汰時回傳 None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None: return None
+            ahead = sum(1 for j in self._jobs.values() if j.status == "queued" and j.created < job.created)
+        snap = job.snapshot()
+        snap["queue_position"] = ahead if snap["status"] == "queued" else 0
+        return snap
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for j in self._jobs.values() if j.status == "running")
+            queued = sum(1 for j in self._jobs.values() if j.status == "queued")
+            return {**self.counts, "running": running, "queued": queued}
+
+@lru_cache(maxsize=None)
+def get_job_manager(runner, workers):
+    """行程內共用：所有 Streamlit session 的分析都經同一個 pool，workers 即全域並行上限"""
+    return JobManager(runner, workers=workers)
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+
+# ==========================================
+# LLM 回應快取 (記憶體 LRU + 選用的磁碟層)
+# ==========================================
+def response_key(model_name, contents, generation_config=None):
+    payload = json.dumps([model_name, contents, generation_config], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """依 response_key 存放模型回應；超過 ttl 秒或總量超過 max_bytes 即淘汰 (最久未使用者先出)"""
+
+    def __init__(self, ttl=24 * 3600, max_bytes=32 << 20, disk_path=None, disk_max_bytes=256 << 20):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.hits = self.misses = 0
+        self._mem = OrderedDict()   # key -> (created, text)
+        self._mem_bytes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if disk_path:
+            self._conn = sqlite3.connect(disk_path, check_same_thread=False, timeout=10)
+            with self._conn:
+                self._conn.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY, response TEXT, size INTEGER, created REAL, last_access REAL)""")
+
+    def _mem_put(self, key, created, text):
+        if key in self._mem: self._mem_bytes -= len(self._mem.pop(key)[1].encode("utf-8"))
+        self._mem[key] = (created, text)
+        self._mem_bytes += len(text.encode("utf-8"))
+        while self._mem_bytes > self.max_bytes and self._mem:
+            _, (_, old) = self._mem.popitem(last=False)
+            self._mem_bytes -= len(old.encode("utf-8"))
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry and now - entry[0] <= self.ttl:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                self._mem_bytes -= len(self._mem.pop(key)[1].encode("utf-8"))
+            if self._conn is not None:
+                with self._conn:
+                    row = self._conn.execute("SELECT response, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                    if row and now - row[1] <= self.ttl:
+                        self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+                        self._mem_put(key, row[1], row[0])
+                        self.hits += 1
+                        return row[0]
+                    if row: self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def put(self, key, text):
+        if text is None: return
+        now = time.time()
+        with self._lock:
+            self._mem_put(key, now, text)
+            if self._conn is None: return
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?)",
+                                   (key, text, len(text.encode("utf-8")), now, now))
+                self._conn.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,))
+                # 依最近使用時間累加大小，超出上限的部分刪除
+                self._conn.execute("""DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_access DESC) AS total FROM llm_cache)
+                    WHERE total > ?)""", (self.disk_max_bytes,))
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._mem), "bytes": self._mem_bytes}
+
+@lru_cache(maxsize=None)
+def get_response_cache(ttl, max_bytes, disk_path=None):
+    """行程內共用同一份快取，Streamlit rerun 不會清空"""
+    return ResponseCache(ttl=ttl, max_bytes=max_bytes, disk_path=disk_path)
+
+# ==========================================
+# 模型 handle 池
+# ==========================================
+class ModelPool:
+    """每個 (API key, 模型名稱) 保留可重複使用的 handle，避免每次呼叫都重建 GenerativeModel。
+    handle 第一次呼叫後就固定使用建立時的 client，因此不同 key 的 handle 分開存放"""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lease(self, model_name, api_key=None):
+        with self._lock:
+            idle = self._idle.setdefault((api_key, model_name), queue.SimpleQueue())
+        try: model = idle.get_nowait()
+        except queue.Empty: model = self.factory(model_name, api_key)
+        try: yield model
+        finally: idle.put(model)
+
+@lru_cache(maxsize=None)
+def get_model_pool(factory):
+    return ModelPool(factory)
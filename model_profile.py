@@ -0,0 +1,142 @@
+"""
+模型延遲探測與各角色選模 (不依賴 Streamlit)
+
+probe() 只透過注入的 list_models / model_factory 存取模型，可直接以假模型驗證：
+
+    profile = probe(lambda: [types.SimpleNamespace(name="models/x", supported_generation_methods=["generateContent"])],
+                    lambda name: FakeModel(name), runs=2)
+    select_models(profile, {"MANAGER": "models/y"})
+"""
+import json
+import os
+import re
+import time
+from functools import lru_cache
+
+from structured_output import INTENT_SCHEMA, JUDGE_SCHEMA, PROSE_SCHEMA, json_config, parse_structured
+
+# 各角色的代表性短 prompt 與驗證輸出用的 schema (None 表示改用 OUTPUT_CHECKS 的格式檢查)
+PROBE_DATA = "【來源】：[物理心得](https://example.com)\n【內文】：老師講解清楚，作業每週一次，期末考偏難但有調分。"
+ROLE_PROBES = {
+    "MANAGER": ('使用者輸入：「物理 施坤龍」\n判斷意圖並輸出 JSON：\n1. 推薦模式 (intent: "recommend")\n'
+                '2. 分析模式 (intent: "analyze")\nJSON format: {"intent": "...", "keywords": "...", "reason": "..."}',
+                INTENT_SCHEMA),
+    "CLEANER": (f"你是資料過濾專家。查詢目標：「物理 施坤龍」。過濾雜訊，完整保留原文。\n資料：\n{PROBE_DATA}", None),
+    "JUDGE": (f"你是【嚴格學術派教授】。目標：「物理 施坤龍」。資料：{PROBE_DATA}。請評分並給予 Tier (S/A/B/C/D)。\n"
+              '**務必輸出純 JSON 格式**：{ "tier": "S", "score": 95, "comment": "簡短評語" }', JUDGE_SCHEMA),
+    "SYNTHESIZER": ('你是最終決策長 (Synthesizer)。目標：「物理 施坤龍」。已決定：綜合 84 分，Tier A。\n'
+                    '任務：撰寫稱號與總結短評。JSON 範例：{ "rank": "硬核大刀", "reason": "...", "tags": [], "details": "..." }',
+                    PROSE_SCHEMA),
+    "FIXER": ('Extract valid JSON:\n好的，結果如下 {"tier": "A", "score": 86, "comment": "內容紮實",}', JUDGE_SCHEMA),
+    "HUNTER": (f"你是北科大選課獵頭。使用者想找：「物理」。參考資料：\n{PROBE_DATA}\n"
+               "請以 Markdown 表格推薦 1 門課程：| 課程 | 老師 | 推薦指數 | 核心推薦理由 |", None),
+}
+
+HUNTER_COLUMNS = ("課程", "老師", "推薦指數", "核心推薦理由")
+
+def cleaner_ok(text):
+    """Cleaner 必須保留來源 / 內文標記與原始連結 (未被摘要掉)"""
+    return all(mark in text for mark in ("【來源】", "【內文】", "https://example.com"))
+
+def hunter_ok(text):
+    """Hunter 必須輸出含四個指定欄位的 Markdown 表格，且至少一列資料"""
+    lines = [line.strip() for line in text.splitlines()]
+    for i, line in enumerate(lines[:-2]):
+        if (line.startswith("|") and all(c in line for c in HUNTER_COLUMNS)
+                and re.fullmatch(r"\|[\s:|-]+\|", lines[i + 1]) and lines[i + 2].startswith("|")):
+            return True
+    return False
+
+OUTPUT_CHECKS = {"CLEANER": cleaner_ok, "HUNTER": hunter_ok}
+
+def output_ok(role, text, schema):
+    if not text or not text.strip(): return False
+    if schema: return parse_structured(text, schema) is not None
+    check = OUTPUT_CHECKS.get(role)
+    return check(text) if check else True
+
+def probe_role(model, model_name, role, runs=3, timeout=30, clock=time.perf_counter):
+    """同一 prompt 呼叫 runs 次：成功的延遲、錯誤數、輸出合格數"""
+    prompt, schema = ROLE_PROBES[role]
+    config = json_config(model_name, schema) if schema else None
+    latencies, errors, ok = [], 0, 0
+    for _ in range(runs):
+        t0 = clock()
+        try: text = model.generate_content(prompt, generation_config=config, request_options={"timeout": timeout}).text
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(clock() - t0)
+        ok += output_ok(role, text, schema)
+    return {"latencies": latencies, "errors": errors, "ok": ok, "runs": runs}
+
+def percentile(values, p):
+    if not values: return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def summarize(stats):
+    runs = stats["runs"]
+    return {"p50": percentile(stats["latencies"], 50), "p95": percentile(stats["latencies"], 95),
+            "error_rate": stats["errors"] / runs if runs else 1.0, "quality": stats["ok"] / runs if runs else 0.0,
+            "runs": runs}
+
+def text_models(list_models, include=None):
+    """支援 generateContent 的模型名稱；include(name) 可再篩選"""
+    return [m.name for m in list_models()
+            if "generateContent" in m.supported_generation_methods and (include is None or include(m.name))]
+
+def probe(list_models, model_factory, roles=None, runs=3, timeout=30, include=None, on_result=None,
+          clock=time.perf_counter):
+    """逐一探測模型 × 角色，回傳 profile：{"created", "runs", "models": {name: {role: 統計}}}。
+    on_result(name, role, 統計) 供 UI 顯示進度"""
+    profile = {"created": time.time(), "runs": runs, "models": {}}
+    for name in text_models(list_models, include):
+        model = model_factory(name)
+        for role in roles or ROLE_PROBES:
+            stats = summarize(probe_role(model, name, role, runs, timeout, clock))
+            profile["models"].setdefault(name, {})[role] = stats
+            if on_result: on_result(name, role, stats)
+    return profile
+
+def save_profile(profile, path):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f: json.dump(profile, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+@lru_cache(maxsize=4)
+def load_profile(path):
+    if not path or not os.path.exists(path): return None
+    try:
+        with open(path, encoding="utf-8") as f: return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Model profile Error: {e}")
+        return None
+
+def probe_role_of(role):
+    """pipeline 的角色名稱 → 探測用角色 (四位評審共用 JUDGE)"""
+    return "JUDGE" if role.startswith("JUDGE_") else role
+
+def role_family(role):
+    """評審保持 Gemma / Gemini 兩派，只在同一系列中挑選"""
+    return role.rsplit("_", 1)[1].lower() if role.startswith("JUDGE_") else None
+
+def select_models(profile, defaults, quality_floor=0.9, max_error_rate=0.2):
+    """每個角色挑 p50 最快、且合格率 ≥ quality_floor、錯誤率 ≤ max_error_rate 的模型；
+    沒有合格者沿用 defaults。回傳 (角色 → 模型, 角色 → 選擇理由)"""
+    chosen, reasons = dict(defaults), {}
+    if not profile: return chosen, reasons
+    for role in defaults:
+        probe_name, family = probe_role_of(role), role_family(role)
+        candidates = []
+        for name, roles in profile.get("models", {}).items():
+            stats = roles.get(probe_name)
+            if not stats or stats["p50"] is None: continue
+            if family and family not in name: continue
+            if stats["quality"] < quality_floor or stats["error_rate"] > max_error_rate: continue
+            candidates.append((stats["p50"], stats["p95"], name))
+        if candidates:
+            p50, p95, name = min(candidates)
+            chosen[role] = name
+            reasons[role] = f"p50 {p50:.2f}s / p95 {p95:.2f}s"
+    return chosen, reasons
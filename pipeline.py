@@ -0,0 +1,726 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import lru_cache
+
+
+import tracing
+from context_pack import pack_context
+from board_store import get_board_store
+from course_index import get_course_index
+from jobs import get_job_manager
+from llm_cache import get_model_pool, get_response_cache, response_key
+from model_profile import load_profile, select_models
+from search_cache import get_search_cache, normalize_query
+from structured_output import (INTENT_SCHEMA, JUDGE_SCHEMA, PROSE_SCHEMA, extract_json, json_config,
+                               parse_structured)
+from scheduler import ModelScheduler, estimate_tokens
+from search_providers import GoogleCSEProvider, TavilyProvider, run_providers
+from verdict_store import get_verdict_store
+
+# ==========================================
+# 課程評價 pipeline (不依賴 Streamlit，可供 app.py 與批次工具共用)
+# ==========================================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))   # 執行期資料：快取、榜單資料庫
+ASSET_DIR = BASE_DIR                                     # 隨程式附帶的底圖
+
+# 設定預設值；型別決定讀入時的轉換方式
+DEFAULTS = {
+    "GEMINI_API_KEY": None,
+    "GOOGLE_SEARCH_API_KEY": None,
+    "SEARCH_ENGINE_ID": None,
+    "TAVILY_API_KEY": None,
+    # 搜尋快取：SEARCH_CACHE_TTL 秒內重複查詢直接讀取；SEARCH_OFFLINE=1 時只重播快取、不連網
+    "SEARCH_CACHE_TTL": 6 * 3600,
+    "SEARCH_CACHE_MAX": 500,
+    "SEARCH_OFFLINE": False,
+    # 所有來源同時查詢：湊滿 SEARCH_MIN_RESULTS 筆或超過 SEARCH_DEADLINE 秒即繼續
+    "SEARCH_MIN_RESULTS": 8,
+    "SEARCH_DEADLINE": 8.0,
+    # LLM 回應快取：LLM_CACHE_DISK=1 時另存磁碟層，重啟後仍可命中
+    "LLM_CACHE_TTL": 24 * 3600,
+    "LLM_CACHE_MAX_MB": 32,
+    "LLM_CACHE_DISK": False,
+    # 本地課程 / 教師清單 (CSV 或 JSON)；能唯一對應時不必呼叫 Manager
+    "COURSE_INDEX": os.path.join(BASE_DIR, "ntut_courses.csv"),
+    # Manager 判斷意圖的同時，先以猜測的關鍵字 (「課程 老師」中的老師名) 搜尋；Manager 回覆相同關鍵字時直接沿用
+    "SPECULATIVE_SEARCH": True,
+    # 送進 Cleaner 的搜尋資料上限 (估計 token 數)，近似重複的片段會先移除
+    "CONTEXT_TOKEN_BUDGET": 3000,
+    # 最終分數在本地計算；SYNTH_PROSE=0 時略過 LLM 撰寫評語
+    "SYNTH_PROSE": True,
+    # 全站同時進行的分析上限 (背景工作)，超過者排隊
+    "ANALYSIS_WORKERS": 2,
+    # 完整分析結果：VERDICT_FRESH 秒內直接使用，之後仍先回傳舊結果並在背景重新分析；超過 VERDICT_MAX_AGE 則重跑
+    "VERDICT_FRESH": 3 * 24 * 3600,
+    "VERDICT_MAX_AGE": 30 * 24 * 3600,
+    # check_models.py 量測的延遲設定檔；各角色改用合格率 ≥ MODEL_QUALITY_FLOOR、錯誤率 ≤ MODEL_MAX_ERROR 中最快的模型
+    "MODEL_PROFILE": os.path.join(BASE_DIR, "model_profile.json"),
+    "MODEL_QUALITY_FLOOR": 0.9,
+    "MODEL_MAX_ERROR": 0.2,
+    # 每次查詢的追蹤紀錄 (JSONL)，設為空字串可關閉
+    "TRACE_LOG": os.path.join(BASE_DIR, "traces.jsonl"),
+}
+SETTINGS = dict(DEFAULTS)
+
+# 背景工作比送出它的 session 活得久，且 SETTINGS 會被其他 session 的 rerun 改寫；
+# 工作送出時擷取 API key，執行期間經 contextvar 讀取
+CREDENTIAL_KEYS = ("GEMINI_API_KEY", "GOOGLE_SEARCH_API_KEY", "SEARCH_ENGINE_ID", "TAVILY_API_KEY")
+_CREDENTIALS = contextvars.ContextVar("credentials", default=None)
+
+# 使用者明確要求重新分析時，整個工作略過搜尋 / LLM 快取 (新結果仍會寫回快取)
+_FRESH = contextvars.ContextVar("fresh", default=False)
+
+def credentials(get=None):
+    """目前的 API key：get 可直接從呼叫端的設定讀取；否則背景工作內為送出時擷取的值，其餘讀 SETTINGS"""
+    if get is not None: return {k: get(k) or None for k in CREDENTIAL_KEYS}
+    return _CREDENTIALS.get() or {k: SETTINGS[k] for k in CREDENTIAL_KEYS}
+
+def _convert(raw, default):
+    if isinstance(default, bool): return str(raw).lower() in ("1", "true", "yes")
+    if isinstance(default, (int, float)): return type(default)(raw)
+    return raw
+
+def configure(get=os.getenv):
+    """get: 依名稱讀取設定的函式 (預設讀環境變數，app.py 傳入 st.secrets 版本)。
+    只更新 SETTINGS，不匯入 SDK；API key 於呼叫模型時依 credentials() 選用對應的 client"""
+    for key, default in DEFAULTS.items():
+        raw = get(key)
+        SETTINGS[key] = default if raw in (None, "") else _convert(raw, default)
+    apply_model_profile()
+    return SETTINGS
+
+def apply_model_profile():
+    """依延遲設定檔更新 MODELS (設定檔每個行程只讀一次)；沒有設定檔時維持 DEFAULT_MODELS"""
+    chosen, reasons = select_models(load_profile(SETTINGS["MODEL_PROFILE"]), DEFAULT_MODELS,
+                                    SETTINGS["MODEL_QUALITY_FLOOR"], SETTINGS["MODEL_MAX_ERROR"])
+    MODELS.update(chosen)
+    MODEL_SELECTION.clear()
+    MODEL_SELECTION.update(reasons)
+    return MODELS
+
+@lru_cache(maxsize=None)
+def genai_sdk():
+    """google.generativeai 匯入約需 0.7 秒，延後到第一次真正呼叫模型時"""
+    import google.generativeai as genai
+    return genai
+
+@lru_cache(maxsize=8)
+def generative_client(api_key):
+    """每個 API key 一個 client；不用 genai.configure，避免並行的工作互相切換全域設定"""
+    from google.ai import generativelanguage as glm
+    return glm.GenerativeServiceClient(client_options={"api_key": api_key})
+
+def search_cache():
+    return get_search_cache(os.path.join(BASE_DIR, "search_cache.db"),
+                            SETTINGS["SEARCH_CACHE_TTL"], SETTINGS["SEARCH_CACHE_MAX"])
+
+def verdict_store():
+    return get_verdict_store(os.path.join(BASE_DIR, "verdicts.db"), SETTINGS["VERDICT_MAX_AGE"])
+
+def course_index():
+    return get_course_index(SETTINGS["COURSE_INDEX"])
+
+def llm_cache():
+    return get_response_cache(
+        ttl=SETTINGS["LLM_CACHE_TTL"],
+        max_bytes=SETTINGS["LLM_CACHE_MAX_MB"] << 20,
+        disk_path=os.path.join(BASE_DIR, "llm_cache.db") if SETTINGS["LLM_CACHE_DISK"] else None,
+    )
+
+def _new_model(name, api_key=None):
+    """api_key 為 None 時沿用 SDK 預設 (GEMINI_API_KEY / GOOGLE_API_KEY 環境變數)"""
+    model = genai_sdk().GenerativeModel(name)
+    if api_key: model._client = generative_client(api_key)
+    return model
+
+MODEL_POOL = get_model_pool(_new_model)
+
+# ==========================================
+# 模型定義
+# ==========================================
+MODELS = {
+    "MANAGER":        "models/gemini-2.5-flash",
+    "CLEANER":        "models/gemini-2.5-flash",
+    
+    "JUDGE_A_Gemma":  "models/gemma-3-27b-it",
+    "JUDGE_A_Gemini": "models/gemini-2.5-flash",
+    "JUDGE_B_Gemma":  "models/gemma-3-27b-it",
+    "JUDGE_B_Gemini": "models/gemini-2.5-flash",
+    
+    "SYNTHESIZER":    "models/gemini-2.5-flash",
+    "FIXER":          "models/gemini-2.5-flash-lite",
+    "HUNTER":         "models/gemini-2.5-flash"
+}
+DEFAULT_MODELS = dict(MODELS)
+MODEL_SELECTION = {}   # 角色 → 依設定檔改選的理由 (apply_model_profile)
+FALLBACK_MODEL = "models/gemini-2.0-flash"
+
+# 綜合分數：各評審權重 (失效的評審不計，其餘重新正規化) 與 Tier 門檻
+VERDICT_WEIGHTS = {"A_Gemma": 1.0, "A_Gemini": 1.0, "B_Gemma": 1.0, "B_Gemini": 1.0}
+TIER_THRESHOLDS = [("S", 90), ("A", 80), ("B", 70), ("C", 60), ("D", 0)]
+TIER_RANKS = {"S": "必修神課", "A": "值得推薦", "B": "中規中矩", "C": "謹慎考慮", "D": "建議避開"}
+
+# 各角色失敗時依序改用的模型 (未列出者使用 FALLBACK_MODEL)
+FALLBACK_CHAINS = {
+    "JUDGE_A_Gemma":  ["models/gemini-2.5-flash-lite", FALLBACK_MODEL],
+    "JUDGE_B_Gemma":  ["models/gemini-2.5-flash-lite", FALLBACK_MODEL],
+    "FIXER":          [FALLBACK_MODEL, "models/gemini-2.5-flash"],
+    "HUNTER":         ["models/gemini-2.5-flash-lite", FALLBACK_MODEL],
+}
+
+# 各模型配額 (RPM / TPM) 與初始併發數，依 AI Studio 專案額度調整
+MODEL_LIMITS = {
+    "models/gemma-3-27b-it":        {"rpm": 30, "tpm": 15000,   "concurrency": 2},
+    "models/gemini-2.5-flash":      {"rpm": 10, "tpm": 250000,  "concurrency": 3},
+    "models/gemini-2.5-flash-lite": {"rpm": 15, "tpm": 250000,  "concurrency": 3},
+    "models/gemini-2.0-flash":      {"rpm": 15, "tpm": 1000000, "concurrency": 3},
+}
+SCHEDULER = ModelScheduler(MODEL_LIMITS)
+
+# 各評審的回應期限 (秒)，逾時即標記為 timed_out，不等待最慢的模型
+JUDGE_DEADLINES = {
+    "JUDGE_A_Gemma":  45,
+    "JUDGE_A_Gemini": 30,
+    "JUDGE_B_Gemma":  45,
+    "JUDGE_B_Gemini": 30,
+}
+
+# ==========================================
+# 榜單
+# ==========================================
+def get_tier_filename(list_type, lang="zh"):
+    suffix = "_en" if lang == "en" else ""
+    return f"tier_list_{list_type}{suffix}.png" if list_type != "Total" else f"final_tier_list{suffix}.png"
+
+def board_store():
+    return get_board_store(os.path.join(BASE_DIR, "boards.db"))
+
+def base_image_path(lang="zh"):
+    return os.path.join(ASSET_DIR, "tier_list.png" if lang == "zh" else "tier_list_en.png")
+
+def get_tier_board(list_type, lang="zh"):
+    from tier_board import get_board   # PIL 延後到真正需要榜單時才匯入
+    return get_board(board_store(), f"{list_type}_{lang}", base_image_path(lang))
+
+_RENDER_POOL = ThreadPoolExecutor(max_workers=3, thread_name_prefix="render")
+
+def render_boards_async(lang="zh"):
+    """背景預先繪製並編碼三張榜單，回傳 future"""
+    def render_all():
+        for l_type in ("A", "B", "Total"):
+            with tracing.span(f"RENDER_{l_type}", kind="render"): get_tier_board(l_type, lang).encode()
+    return _RENDER_POOL.submit(tracing.bind(render_all))
+
+def update_tier_list_image(list_type, course_name, tier, lang="zh", owner=None):
+    """只更新榜單資料，圖片於顯示時才重新繪製；owner 為加入者的 session，供 clear_my_boards 使用"""
+    with tracing.span(f"BOARD_{list_type}", kind="render", tier=tier):
+        get_tier_board(list_type, lang).add(course_name, tier, owner)
+    return True
+
+def clear_my_boards(owner):
+    """只移除此 session 加入的卡片，不影響其他使用者"""
+    return board_store().remove_owner(owner)
+
+# ==========================================
+# Agent 邏輯
+# ==========================================
+def model_chain(model_name, role=None):
+    chain = [model_name] + FALLBACK_CHAINS.get(role, [FALLBACK_MODEL])
+    return list(dict.fromkeys(chain))
+
+def _usage(res):
+    usage = getattr(res, "usage_metadata", None)
+    return {"prompt_tokens": getattr(usage, "prompt_token_count", None),
+            "response_tokens": getattr(usage, "candidates_token_count", None),
+            "total_tokens": getattr(usage, "total_token_count", None)}
+
+def call_ai(contents, model_name, timeout=None, generation_config=None, use_cache=True, role=None, api_key=None):
+    """timeout: 整體期限 (秒)，含 fallback；None 表示不限。相同 (模型, prompt, config) 直接回傳快取。
+    呼叫經 SCHEDULER 限流，429/5xx 退避重試，仍失敗則依 role 的 fallback 鏈換模型。
+    api_key 預設為 credentials() (背景工作內即送出者的 key)"""
+    with tracing.span(role or model_name, kind="llm", model=model_name) as sp:
+        key = response_key(model_name, contents, generation_config)
+        if use_cache and not _FRESH.get():
+            cached = llm_cache().get(key)
+            if cached is not None:
+                sp["cache"] = "hit"
+                return cached
+        sp["cache"] = "miss"
+        api_key = api_key or credentials()["GEMINI_API_KEY"]
+        deadline = time.monotonic() + timeout if timeout else None
+        usage = {}
+        def generate(name):
+            kwargs = {"generation_config": generation_config} if generation_config else {}
+            if deadline is not None: kwargs["request_options"] = {"timeout": max(1, deadline - time.monotonic())}
+            with MODEL_POOL.lease(name, api_key) as model:
+                res = model.generate_content(contents, **kwargs)
+            usage.update(_usage(res))
+            return res.text, usage["total_tokens"]
+        text, used_model = SCHEDULER.run(model_chain(model_name, role), generate, tokens=estimate_tokens(contents), deadline=deadline)
+        sp.update(prompt_tokens=usage.get("prompt_tokens"), response_tokens=usage.get("response_tokens"),
+                  model=used_model or model_name, fallback=bool(used_model and used_model != model_name),
+                  status="ok" if text is not None else "error")
+        llm_cache().put(key, text)
+        return text
+
+def call_ai_stream(contents, model_name, generation_config=None, use_cache=True, role=None, api_key=None):
+    """call_ai 的串流版本：逐段 yield 文字，完整結束後才寫入快取。
+    第一段抵達前的失敗同樣會重試 / fallback；中途斷線則停止輸出"""
+    with tracing.span(role or model_name, kind="llm", model=model_name, stream=True) as sp:
+        key = response_key(model_name, contents, generation_config)
+        if use_cache and not _FRESH.get():
+            cached = llm_cache().get(key)
+            if cached is not None:
+                sp["cache"] = "hit"
+                yield cached
+                return
+        sp["cache"] = "miss"
+        api_key = api_key or credentials()["GEMINI_API_KEY"]
+        t0 = time.perf_counter()
+        def start(name):
+            kwargs = {"generation_config": generation_config} if generation_config else {}
+            with MODEL_POOL.lease(name, api_key) as model:
+                chunks = iter(model.generate_content(contents, stream=True, **kwargs))
+            return (next(chunks), chunks), None
+        started, used_model = SCHEDULER.run(model_chain(model_name, role), start, tokens=estimate_tokens(contents))
+        sp.update(model=used_model or model_name, fallback=bool(used_model and used_model != model_name))
+        if started is None:
+            sp["status"] = "error"
+            return
+        sp["ttft"] = round(time.perf_counter() - t0, 4)
+        first, rest = started
+        parts = []
+        chunk = first
+        try:
+            for chunk in itertools.chain([first], rest):
+                try: text = chunk.text
+                except ValueError: continue   # 無文字內容的片段 (例如僅含安全評分)
+                parts.append(text)
+                yield text
+        except Exception as e:
+            print(f"{model_name} Stream Error: {e}")
+            sp["status"] = "interrupted"
+            return
+        # 串流的 usage_metadata 在最後一段才是完整累計值
+        u = _usage(chunk)
+        sp.update(prompt_tokens=u["prompt_tokens"], response_tokens=u["response_tokens"], status="ok")
+        llm_cache().put(key, "".join(parts))
+
+def local_intent(user_query):
+    """查本地索引判斷意圖並正規化關鍵字；無法唯一對應時回傳 None (改由 Manager 判斷)"""
+    with tracing.span("INTENT_INDEX", kind="local") as sp:
+        match = course_index().match(user_query)
+        sp["hit"] = match is not None
+    if match is None: return None
+    return {**match, "reason": "local index"}
+
+def agent_manager(user_query):
+    prompt = f"""
+    使用者輸入：「{user_query}」
+    判斷意圖並輸出 JSON：
+    1. 推薦模式 (intent: "recommend"): 僅有課程名 -> keywords: 課程名
+    2. 分析模式 (intent: "analyze"): 含老師名 -> keywords: 老師名
+    JSON format: {{"intent": "...", "keywords": "...", "reason": "..."}}
+    """
+    res = call_ai(prompt, MODELS["MANAGER"], generation_config=json_config(MODELS["MANAGER"], INTENT_SCHEMA), role="MANAGER")
+    data = parse_structured(res, INTENT_SCHEMA)
+    if data is None: return {"intent": "recommend", "keywords": user_query}
+    data["intent"] = str(data["intent"]).strip().lower()
+    # keywords 可能是 null / 空字串 (conforms 不檢查字串型別)
+    if not data.get("keywords") or len(str(data.get("keywords")).strip()) == 0:
+        data["keywords"] = user_query
+    return data
+
+def get_search_providers():
+    keys = credentials()
+    providers = []
+    if keys["GOOGLE_SEARCH_API_KEY"] and keys["SEARCH_ENGINE_ID"]:
+        providers.append(GoogleCSEProvider(keys["GOOGLE_SEARCH_API_KEY"], keys["SEARCH_ENGINE_ID"]))
+    if keys["TAVILY_API_KEY"]: providers.append(TavilyProvider(keys["TAVILY_API_KEY"]))
+    return providers
+
+def search_hybrid(query, mode="analysis"):
+    with tracing.span("SEARCH", kind="search", mode=mode) as sp:
+        # 離線模式只能重播快取，即使要求重新分析
+        use_cache = not _FRESH.get() or SETTINGS["SEARCH_OFFLINE"]
+        cached = search_cache().get(query, mode, allow_stale=SETTINGS["SEARCH_OFFLINE"]) if use_cache else None
+        if cached is not None:
+            sp.update(cache="hit", results=len(cached))
+            return cached
+        sp["cache"] = "miss"
+        if SETTINGS["SEARCH_OFFLINE"]: return []
+
+        providers = get_search_providers()
+        results = run_providers(providers, query, mode,
+                                min_results=SETTINGS["SEARCH_MIN_RESULTS"], deadline=SETTINGS["SEARCH_DEADLINE"])
+        sp.update(providers=[p.name for p in providers], results=len(results))
+        if results: search_cache().put(query, mode, results)
+        return results
+
+_SPEC_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculate")
+_SPEC_LOCK = threading.Lock()
+SPEC_STATS = {"hits": 0, "misses": 0, "cancelled": 0}
+
+def guess_keywords(user_input):
+    """Manager 回覆前猜測它會給的搜尋 (模式, 關鍵字)。依 Manager 的約定，「課程 老師」為分析模式、keywords 只有老師名：
+    索引認得的課程名以外的詞視為老師，索引都不認得時取最後一個詞。單一詞可能是課程也可能是老師，不猜 (None)"""
+    tokens = normalize_query(user_input).split(" ")
+    if len(tokens) < 2: return None
+    teacher = [t for t in tokens if "course" not in course_index().kinds(t)]
+    if len(teacher) == len(tokens): teacher = tokens[-1:]
+    return ("analysis", " ".join(teacher)) if teacher else None
+
+class SpeculativeSearch:
+    """與 Manager 並行，先以猜測的關鍵字搜尋；Manager 回覆的模式與正規化後的關鍵字完全相同才沿用，否則捨棄重搜。
+    搜尋的就是真正的關鍵字，結果照常寫入搜尋快取"""
+
+    def __init__(self, user_input, enabled=True):
+        self.guess = guess_keywords(user_input)
+        self.future = None
+        if enabled and self.guess and SETTINGS["SPECULATIVE_SEARCH"] and not SETTINGS["SEARCH_OFFLINE"]:
+            mode, keywords = self.guess
+            self.future = _SPEC_POOL.submit(tracing.bind(search_hybrid), keywords, mode)
+
+    def search(self, keywords, mode):
+        if self.future is None: return search_hybrid(keywords, mode=mode)
+        fut, self.future = self.future, None
+        hit = self.guess == (mode, normalize_query(keywords))
+        results = None
+        with tracing.span("SPECULATE", kind="local", hit=hit, guess=self.guess[1]) as sp:
+            if hit:
+                try: results = fut.result()
+                except Exception as e: print(f"Speculative search Error: {e}")
+            else:
+                # 尚未開始就取消；已在執行者讓它跑完 (結果仍會寫入搜尋快取)
+                sp["cancelled"] = fut.cancel()
+        with _SPEC_LOCK:
+            SPEC_STATS["hits" if hit else "misses"] += 1
+            SPEC_STATS["cancelled"] += bool(sp.get("cancelled"))
+        return results if results is not None else search_hybrid(keywords, mode=mode)
+
+def speculation_stats():
+    with _SPEC_LOCK: stats = dict(SPEC_STATS)
+    total = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / total if total else 0.0
+    return stats
+
+def prepare_context(query, raw_data):
+    """Cleaner 之前的本地前處理：去重、依相關度排序並裁切到 CONTEXT_TOKEN_BUDGET"""
+    with tracing.span("PACK", kind="local") as sp:
+        packed, stats = pack_context(query, raw_data, SETTINGS["CONTEXT_TOKEN_BUDGET"], estimate=estimate_tokens)
+        sp.update(stats)
+    return packed, stats
+
+def agent_cleaner(course_name, raw_data, stream=False):
+    """資料清理專員"""
+    if isinstance(raw_data, list): raw_data = "\n\n".join(raw_data)
+    prompt = f"""
+    你是資料過濾專家。查詢目標：「{course_name}」。
+    任務：過濾雜訊，保留北科大/教學相關完整資料。
+    
+    規則：
+    1. 完整保留原文，不摘要。
+    2. 刪除無關雜訊(廣告/導航/亂碼)。
+    3. 特別保留「北科課程好朋友」數據。
+    
+    強制輸出格式 (請勿使用標題語法 #，改用粗體)：
+    ---------------------------
+    【來源】：[連結標題](連結網址)
+    【內文】：
+    (內容...)
+    ---------------------------
+    
+    資料：{raw_data}
+    """
+    if stream: return call_ai_stream(prompt, MODELS["CLEANER"], role="CLEANER")
+    return call_ai(prompt, MODELS["CLEANER"], role="CLEANER")
+    
+def agent_judge_panel(course_name, data):
+    base_prompt = f"""
+    目標：「{course_name}」。資料：{data}。
+    請評分並給予 Tier (S/A/B/C/D)。
+    **務必輸出純 JSON 格式**：{{ "tier": "S", "score": 95, "comment": "簡短評語" }}
+    """
+    prompt_a = f"你是【嚴格學術派教授】。專注：紮實度、專業性。{base_prompt}"
+    prompt_b = f"你是【想輕鬆通過的同學】。專注：甜度、好過。{base_prompt}"
+    jobs = {
+        "A_Gemma":  (prompt_a, "JUDGE_A_Gemma"),
+        "A_Gemini": (prompt_a, "JUDGE_A_Gemini"),
+        "B_Gemma":  (prompt_b, "JUDGE_B_Gemma"),
+        "B_Gemini": (prompt_b, "JUDGE_B_Gemini"),
+    }
+    
+    start = time.monotonic()
+
+    def timed_out(role):
+        return {"tier": None, "score": None, "comment": f"逾時 ({JUDGE_DEADLINES[role]}s) 未回應", "status": "timed_out"}
+
+    def judge(prompt, role):
+        """評分與 Fixer 修復都在同一個 future 內，共用該評審的期限"""
+        deadline = start + JUDGE_DEADLINES[role]
+        raw_text = call_ai(prompt, MODELS[role], JUDGE_DEADLINES[role],
+                           generation_config=json_config(MODELS[role], JUDGE_SCHEMA), role=role)
+        if raw_text is None:
+            # 期限內一直在等 RPM/TPM 額度或退避時，call_ai 同樣回傳 None，這屬於逾時而非模型錯誤
+            if time.monotonic() >= deadline: return timed_out(role)
+            return {"tier": None, "score": None, "comment": "模型無回應", "status": "error"}
+        # 先本地擷取，失敗才交給 Fixer
+        data = parse_structured(raw_text, JUDGE_SCHEMA)
+        remaining = deadline - time.monotonic()
+        if data is None and remaining > 1: data = agent_fixer(raw_text, JUDGE_SCHEMA, timeout=remaining)
+        # 無法解析者不給預設分數，不計入判決與榜單
+        return data or {"tier": None, "score": None, "comment": str(raw_text)[:100], "status": "unparsed"}
+
+    # 四位評審同時開跑，各自有期限；逾時者回傳 timed_out 標記，不套用預設分數。
+    # 已開始的呼叫無法中途取消，只是不再等待 (call_ai 本身也受同一期限約束)
+    pool = ThreadPoolExecutor(max_workers=len(jobs))
+    futures = {k: pool.submit(tracing.bind(judge), p, role) for k, (p, role) in jobs.items()}
+    results = {}
+    for k, (_, role) in jobs.items():
+        remaining = JUDGE_DEADLINES[role] - (time.monotonic() - start)
+        try: results[k] = futures[k].result(timeout=max(0, remaining))
+        except FutureTimeout: results[k] = timed_out(role)
+    pool.shutdown(wait=False)
+    return results
+
+def judge_ok(res):
+    return res.get("status") not in ("timed_out", "error", "unparsed")
+
+def panel_tier(panel_results, side):
+    """取該派別第一個有效評審的 Tier (Gemini 優先)，全數失敗回傳 None"""
+    for k in (f"{side}_Gemini", f"{side}_Gemma"):
+        if judge_ok(panel_results[k]): return panel_results[k].get("tier", "C")
+    return None
+
+def format_judge(res):
+    if res.get("status") == "unparsed": return f"⚠️ 無法解析：{res['comment']}"
+    if not judge_ok(res): return f"⏱ {res['comment']}"
+    return f"{res.get('score')}分\n{res.get('comment')}"
+
+def score_to_tier(score, thresholds=None):
+    for tier, floor in thresholds or TIER_THRESHOLDS:
+        if score >= floor: return tier
+    return "D"
+
+def stars(score):
+    n = min(5, max(1, round(score / 20)))
+    return "★" * n + "☆" * (5 - n)
+
+def aggregate_verdict(panel_results, weights=None, thresholds=None):
+    """由評審分數計算最終分數 / Tier / 星等 (純本地運算)；全部評審失效時回傳 None"""
+    weights = weights or VERDICT_WEIGHTS
+    valid = {k: float(v["score"]) for k, v in panel_results.items()
+             if judge_ok(v) and isinstance(v.get("score"), (int, float)) and weights.get(k, 0) > 0}
+    if not valid: return None
+    total_w = sum(weights[k] for k in valid)
+    score = round(sum(valid[k] * weights[k] for k in valid) / total_w)
+
+    def side_avg(side):
+        scores = [v for k, v in valid.items() if k.startswith(side)]
+        return sum(scores) / len(scores) if scores else score
+    learning, sweet = side_avg("A"), side_avg("B")
+    # 輕鬆度：甜涼派分數與學術派「硬度」的平均
+    chill = (sweet + (100 - learning)) / 2
+    tier = score_to_tier(score, thresholds)
+    return {"tier": tier, "score": score,
+            "star_ratings": {"learning": stars(learning), "chill": stars(chill), "sweet": stars(sweet)},
+            "judges": len(valid)}
+
+def agent_synthesizer(course_name, panel_results, verdict, stream=False):
+    """分數已在本地算好，這裡只請 LLM 撰寫評語 (rank / reason / tags / details)"""
+    panel_text = json.dumps({k: v for k, v in panel_results.items() if judge_ok(v)}, ensure_ascii=False, indent=2)
+    prompt = f"""
+    你是最終決策長 (Synthesizer)。目標：「{course_name}」。
+    意見：{panel_text}
+    已決定：綜合 {verdict['score']} 分，Tier {verdict['tier']}，星等 {json.dumps(verdict['star_ratings'], ensure_ascii=False)}。
+    任務：依上述結果撰寫稱號與總結短評 (不要更改分數)。
+    JSON 範例：
+    {{ "rank": "硬核大刀", "reason": "...", "tags": [], "details": "..." }}
+    """
+    config = json_config(MODELS["SYNTHESIZER"], PROSE_SCHEMA)
+    if stream: return call_ai_stream(prompt, MODELS["SYNTHESIZER"], generation_config=config, role="SYNTHESIZER")
+    return call_ai(prompt, MODELS["SYNTHESIZER"], generation_config=config, role="SYNTHESIZER")
+
+def agent_hunter(topic, data, stream=False):
+    prompt = f"""
+    你是北科大選課獵頭。使用者想找：「{topic}」。
+    
+    參考資料 (已過濾)：
+    {data}
+    
+    請推薦 **3 門** 最符合需求的課程或老師。
+    
+    請務必使用 **Markdown 表格** 呈現，欄位如下(推薦指數用★★★★★表示)：
+    | 課程 | 老師 | 推薦指數 | 核心推薦理由 |
+    |---|---|---|---|
+    
+    (請在表格下方補充一段總結建議)
+    """
+    if stream: return call_ai_stream(prompt, MODELS["HUNTER"], role="HUNTER")
+    return call_ai(prompt, MODELS["HUNTER"], role="HUNTER")
+
+def agent_fixer(text, schema=None, timeout=None):
+    config = json_config(MODELS["FIXER"], schema) if schema else None
+    res = call_ai(f"Extract valid JSON:\n{text}", MODELS["FIXER"], timeout, generation_config=config, role="FIXER")
+    return parse_structured(res, schema) if schema else extract_json(res)
+
+def parse_prose(text):
+    """Synthesizer 評語；本地擷取失敗才多花一次 Fixer 呼叫"""
+    with tracing.span("PARSE_PROSE", kind="local") as sp:
+        data = parse_structured(text, PROSE_SCHEMA)
+        sp["local"] = data is not None
+    return data or (agent_fixer(text, PROSE_SCHEMA) if text else None)
+
+def merge_prose(verdict, prose, panel_results):
+    """數值判決 + 評語；沒有評語時以 Tier 稱號與評審短評補上"""
+    if not prose:
+        comments = [v.get("comment") for v in panel_results.values() if judge_ok(v) and v.get("comment")]
+        prose = {"rank": TIER_RANKS[verdict["tier"]], "reason": " / ".join(comments[:2]), "tags": [], "details": ""}
+    return {**verdict, **{k: prose.get(k) for k in ("rank", "reason", "tags", "details")}}
+
+def synthesize(course_name, panel_results, progress=None):
+    """本地計算判決，需要時再補上 LLM 評語"""
+    verdict = aggregate_verdict(panel_results)
+    if verdict is None: return None
+    if progress: progress("verdict", verdict=verdict, panel=panel_results)
+    prose = None
+    if SETTINGS["SYNTH_PROSE"]:
+        prose = parse_prose(_generate(agent_synthesizer, (course_name, panel_results, verdict), "prose", progress))
+    return merge_prose(verdict, prose, panel_results)
+
+def _generate(agent, args, stage, progress=None):
+    """有 progress 時以串流呼叫 agent 並逐段回報目前全文，否則一次取回"""
+    if progress is None: return agent(*args)
+    progress(stage)
+    parts = []
+    for chunk in agent(*args, stream=True):
+        parts.append(chunk)
+        progress(stage, text="".join(parts))
+    return "".join(parts)
+
+# ==========================================
+# 完整流程 (無 UI)
+# ==========================================
+def run_query(user_input, progress=None, fresh=False):
+    """Index / Manager → Search → Cleaner → Judges → Synthesizer (或 Hunter)，回傳可序列化的結果 dict。
+    progress(stage, **info)：各階段開始與中間結果的回報 (背景工作用)，此時 LLM 輸出改為串流。
+    fresh=True 時略過搜尋與 LLM 快取"""
+    token = _FRESH.set(fresh)
+    try: return _run_query(user_input, progress)
+    finally: _FRESH.reset(token)
+
+def _run_query(user_input, progress):
+    report = progress or (lambda stage, **info: None)
+    intent_data = local_intent(user_input)
+    # 本地索引已確定關鍵字時不需預先搜尋
+    spec = SpeculativeSearch(user_input, enabled=intent_data is None)
+    if intent_data is None:
+        report("manager")
+        intent_data = agent_manager(user_input)
+    intent = intent_data.get("intent", "recommend")
+    keywords = intent_data.get("keywords", user_input)
+    result = {"query": user_input, "intent": intent, "keywords": keywords}
+    report("search", intent=intent, keywords=keywords)
+    raw_data = spec.search(keywords, "analysis" if intent == "analyze" else "recommend")
+    result["sources"] = len(raw_data)
+    if intent == "analyze" and not raw_data:
+        result["error"] = "no_search_results"
+        return result
+    context, pack_stats = prepare_context(keywords, raw_data)
+    report("clean", raw=raw_data, pack=pack_stats)
+    curated = _generate(agent_cleaner, (keywords, context), "clean", progress)
+    report("clean", curated=curated)
+    if intent == "analyze":
+        report("judges")
+        panel_res = agent_judge_panel(keywords, curated)
+        result["panel"] = panel_res
+        report("judges", panel=panel_res)
+        result["verdict"] = synthesize(keywords, panel_res, progress)
+        if not result["verdict"]: result["error"] = "synthesis_failed"
+    else:
+        result["report"] = _generate(agent_hunter, (keywords, curated), "hunter", progress)
+    return result
+
+def query_key(user_input):
+    """(分析結果庫 / 工作合併用的 key, 榜單卡片名稱)：能對應課程索引時取正規化的「課程 老師」"""
+    match = course_index().match(user_input)
+    if match: return normalize_query(match["query"]), match["query"]
+    return normalize_query(user_input), user_input.strip()
+
+def place_on_boards(result, name, lang="zh", owner=None):
+    placements = board_placements(result)
+    for l_type, tier in placements: update_tier_list_image(l_type, name, tier, lang=lang, owner=owner)
+    return render_boards_async(lang) if placements else None
+
+def _run_job(user_input, progress, subscribers, keys=None, fresh=False):
+    """背景工作：跑完整流程；數值判決一出來就替每個訂閱者 ({"lang", "owner"}) 放上榜單並在背景繪製，
+    與評語撰寫重疊；之後才併入的訂閱者於結束時補上。成功的結果寫入分析結果庫"""
+    key, name = query_key(user_input)
+    render = []
+
+    def place(result, subs):
+        render.extend(place_on_boards(result, name, s.get("lang", "zh"), s.get("owner")) for s in subs)
+
+    def on_progress(stage, **info):
+        if stage == "verdict": place({"intent": "analyze", **info}, subscribers())
+        progress(stage, **info)
+
+    token = _CREDENTIALS.set(keys)
+    try:
+        with tracing.trace(user_input, SETTINGS["TRACE_LOG"]) as tr:
+            result = run_query(user_input, on_progress, fresh=fresh)
+            place(result, subscribers(close=True))
+            for job in render:
+                if job: job.result()
+    finally:
+        _CREDENTIALS.reset(token)
+    if not result.get("error") and (result.get("verdict") or result.get("report")):
+        verdict_store().put(key, user_input, result)
+    return {**result, "trace": tr.to_dict()}
+
+def job_manager():
+    return get_job_manager(_run_job, SETTINGS["ANALYSIS_WORKERS"])
+
+def submit_query(user_input, lang="zh", owner=None, keys=None, fresh=False):
+    """回傳工作 ID。分析結果庫有結果時立即以已完成的工作回傳，超過 VERDICT_FRESH 秒者另在背景重新分析
+    (stale-while-revalidate)；同一課程進行中的查詢會併入同一個工作。
+    keys：此次送出者的 API key (credentials())，工作全程使用，不受其他 session 改寫 SETTINGS 影響。
+    fresh=True (使用者按「重新分析」)：不讀分析結果庫、搜尋與 LLM 快取，也不併入一般的進行中工作"""
+    keys = keys or credentials()
+    key, name = query_key(user_input)
+    store = verdict_store()
+    store.record(key, user_input)
+    subscriber = {"lang": lang, "owner": owner}
+    if fresh: return job_manager().submit(user_input, key=f"{key}|fresh", subscriber=subscriber, keys=keys, fresh=True)
+    cached = store.get(key)
+    if cached is None: return job_manager().submit(user_input, key=key, subscriber=subscriber, keys=keys)
+    result, age = cached
+    refreshing = age > SETTINGS["VERDICT_FRESH"]
+    if refreshing: job_manager().submit(user_input, key=key, subscriber=subscriber, keys=keys)
+    place_on_boards(result, name, lang, owner)
+    return job_manager().completed(user_input, result, intent=result["intent"], keywords=result["keywords"],
+                                   panel=result.get("panel"), verdict=result.get("verdict"),
+                                   cached_age=round(age), refreshing=refreshing)
+
+def invalidate_verdict(user_input=None):
+    """刪除某課程 (或全部) 的既有分析結果，下次查詢會重新分析"""
+    return verdict_store().invalidate(query_key(user_input)[0] if user_input else None)
+
+def warm_up(limit=20):
+    """預熱：替查詢次數最多、沒有結果或結果已過時的課程送出背景分析，回傳工作 ID 列表。
+    預熱沒有訂閱者，不會放上共用榜單 (之後有人查詢時才以該 session 加入)"""
+    keys = credentials()
+    return [job_manager().submit(query, key=key, keys=keys)
+            for key, query, _ in verdict_store().top(limit, older_than=SETTINGS["VERDICT_FRESH"])]
+
+def board_placements(result):
+    """分析結果應放上的榜單：[(list_type, tier)]"""
+    if result.get("intent") != "analyze" or not result.get("verdict"): return []
+    placements = [(side, panel_tier(result["panel"], side)) for side in ("A", "B")]
+    placements.append(("Total", result["verdict"].get("tier", "C")))
+    return [(l_type, tier) for l_type, tier in placements if tier]
@@ -0,0 +1,155 @@
+import random
+import re
+import threading
+import time
+
+# ==========================================
+# 模型呼叫排程：每模型 RPM/TPM token bucket + 自適應併發 + 退避重試 + fallback 鏈
+# ==========================================
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+# google.api_core.exceptions 中對應的類別 (以名稱比對，不必為此匯入 SDK)
+RETRYABLE_TYPES = {"ResourceExhausted", "TooManyRequests", "InternalServerError", "BadGateway",
+                   "ServiceUnavailable", "GatewayTimeout", "DeadlineExceeded"}
+_STATUS_RE = re.compile(r"(?<!\d)(429|500|502|503|504)(?!\d)")
+
+def is_retryable(exc):
+    """google.api_core 例外依類別 / HTTP code 判斷；其他 SDK 才從訊息中找獨立的狀態碼
+    (「5000 tokens」之類的數字不算)"""
+    if any(cls.__name__ in RETRYABLE_TYPES for cls in type(exc).__mro__): return True
+    code = getattr(exc, "code", None)
+    if isinstance(code, int): return code in RETRYABLE_CODES
+    msg = str(exc)
+    return bool(_STATUS_RE.search(msg)) or "Resource has been exhausted" in msg
+
+def estimate_tokens(contents):
+    # 中文約 1 字 1 token，英文約 4 字 1 token；取保守值
+    return max(1, len(str(contents)) // 2)
+
+class TokenBucket:
+    """每分鐘補充 per_minute 單位；容量即一分鐘額度"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, n=1, deadline=None):
+        """阻塞直到取得 n 單位；超過 deadline 回傳 False"""
+        n = min(n, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.level >= n:
+                    self.level -= n
+                    return True
+                wait = (n - self.level) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline: return False
+            time.sleep(min(wait, 1.0))
+
+    def adjust(self, n):
+        """依實際用量補扣 (n 可為負)"""
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level - n)
+
+class AdaptiveLimit:
+    """AIMD 併發上限：成功且延遲正常時緩慢增加，遇到限流/錯誤或延遲暴增時減半"""
+
+    def __init__(self, initial=2, minimum=1, maximum=8, latency_factor=2.5):
+        self.limit = float(initial)
+        self.minimum, self.maximum = minimum, maximum
+        self.latency_factor = latency_factor
+        self.inflight = 0
+        self.best_latency = None
+        self._cond = threading.Condition()
+
+    def acquire(self, deadline=None):
+        with self._cond:
+            while self.inflight >= int(self.limit):
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0: return False
+                self._cond.wait(timeout)
+            self.inflight += 1
+            return True
+
+    def release(self, latency=None, failed=False):
+        with self._cond:
+            self.inflight -= 1
+            if failed:
+                self.limit = max(self.minimum, self.limit / 2)
+            elif latency is not None:
+                self.best_latency = latency if self.best_latency is None else min(self.best_latency, latency)
+                if latency > self.best_latency * self.latency_factor:
+                    self.limit = max(self.minimum, self.limit * 0.9)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+class ModelScheduler:
+    def __init__(self, limits, default_limit=None, max_retries=3, base_backoff=1.0, max_backoff=20.0):
+        """limits: {model_name: {"rpm": int, "tpm": int, "concurrency": int}}"""
+        self.limits = limits
+        self.default_limit = default_limit or {"rpm": 10, "tpm": 250000, "concurrency": 2}
+        self.max_retries = max_retries
+        self.base_backoff, self.max_backoff = base_backoff, max_backoff
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def _model_state(self, model_name):
+        with self._lock:
+            if model_name not in self._state:
+                cfg = {**self.default_limit, **self.limits.get(model_name, {})}
+                self._state[model_name] = {
+                    "requests": TokenBucket(cfg["rpm"]),
+                    "tokens": TokenBucket(cfg["tpm"]),
+                    "concurrency": AdaptiveLimit(initial=cfg["concurrency"], maximum=cfg["concurrency"] * 4),
+                    "calls": 0, "retries": 0, "errors": 0, "fallbacks": 0,
+                }
+            return self._state[model_name]
+
+    def _backoff(self, attempt):
+        # full jitter
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    def run(self, models, fn, tokens=1, deadline=None):
+        """依序嘗試 models (主模型 + fallback 鏈)，回傳 (結果, 實際模型)；全部失敗回傳 (None, None)
+        fn(model_name) 回傳 (結果, 實際 token 數或 None)"""
+        for i, model_name in enumerate(models):
+            state = self._model_state(model_name)
+            if i > 0: state["fallbacks"] += 1
+            for attempt in range(self.max_retries + 1):
+                if not state["requests"].acquire(1, deadline): break
+                if not state["tokens"].acquire(tokens, deadline): break
+                if not state["concurrency"].acquire(deadline): break
+                start = time.monotonic()
+                state["calls"] += 1
+                try:
+                    result, used = fn(model_name)
+                except Exception as e:
+                    state["concurrency"].release(failed=is_retryable(e))
+                    state["errors"] += 1
+                    print(f"{model_name} Error: {e}")
+                    if not is_retryable(e) or attempt == self.max_retries: break
+                    delay = self._backoff(attempt)
+                    if deadline is not None and time.monotonic() + delay >= deadline: break
+                    state["retries"] += 1
+                    time.sleep(delay)
+                    continue
+                state["concurrency"].release(latency=time.monotonic() - start)
+                if used: state["tokens"].adjust(used - tokens)
+                return result, model_name
+            if deadline is not None and time.monotonic() >= deadline: break
+        return None, None
+
+    def stats(self):
+        with self._lock:
+            return {name: {"limit": round(s["concurrency"].limit, 2), "inflight": s["concurrency"].inflight,
+                           "calls": s["calls"], "retries": s["retries"], "errors": s["errors"], "fallbacks": s["fallbacks"]}
+                    for name, s in self._state.items()}
@@ -0,0 +1,75 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from functools import lru_cache
+
+# ==========================================
+# 搜尋結果快取 (SQLite, TTL + LRU)
+# ==========================================
+def normalize_query(query):
+    q = unicodedata.normalize("NFKC", str(query)).lower()
+    return re.sub(r"\s+", " ", q).strip()
+
+class SearchCache:
+    """以 (正規化查詢, mode) 為 key 的持久快取；超過 max_entries 時淘汰最久未使用者"""
+
+    def __init__(self, path, ttl=6 * 3600, max_entries=500):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS search_cache (
+                query TEXT, mode TEXT, results TEXT,
+                created REAL, last_access REAL,
+                PRIMARY KEY (query, mode))""")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, value INTEGER)")
+            self._conn.execute("INSERT OR IGNORE INTO cache_stats VALUES ('hits', 0), ('misses', 0)")
+
+    def _count(self, name):
+        self._conn.execute("UPDATE cache_stats SET value = value + 1 WHERE name = ?", (name,))
+
+    def get(self, query, mode, allow_stale=False):
+        """命中回傳結果 list，未命中或過期回傳 None；allow_stale 供離線重播使用"""
+        key = (normalize_query(query), mode)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT results, created FROM search_cache WHERE query = ? AND mode = ?", key).fetchone()
+            if row is None or (not allow_stale and now - row[1] > self.ttl):
+                self._count("misses")
+                return None
+            self._conn.execute(
+                "UPDATE search_cache SET last_access = ? WHERE query = ? AND mode = ?", (now, *key))
+            self._count("hits")
+        return json.loads(row[0])
+
+    def put(self, query, mode, results):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?, ?)",
+                (normalize_query(query), mode, json.dumps(results, ensure_ascii=False), now, now))
+            self._conn.execute("""DELETE FROM search_cache WHERE rowid IN (
+                SELECT rowid FROM search_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)""",
+                (self.max_entries,))
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM cache_stats").fetchall())
+            counters["entries"] = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        return counters
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM search_cache")
+            self._conn.execute("UPDATE cache_stats SET value = 0")
+
+@lru_cache(maxsize=None)
+def get_search_cache(path, ttl, max_entries):
+    """行程內共用同一個連線，Streamlit rerun 不會重開"""
+    return SearchCache(path, ttl=ttl, max_entries=max_entries)
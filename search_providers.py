@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from context_pack import normalize_url
+
+# ==========================================
+# 搜尋來源 (可插拔)
+# ==========================================
+# 連線與 client 在模組層級共用，Streamlit rerun 時不會重建
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=16))
+_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+
+TavilyClient = None   # 第一次建立 client 時才匯入 tavily
+
+@lru_cache(maxsize=4)
+def get_tavily_client(api_key):
+    global TavilyClient
+    if TavilyClient is None: from tavily import TavilyClient
+    return TavilyClient(api_key=api_key)
+
+class SearchProvider:
+    """新增來源：繼承並實作 search()，回傳 [{"title", "snippet", "link"}]"""
+    name = "Base"
+
+    def search(self, query, mode):
+        raise NotImplementedError
+
+class GoogleCSEProvider(SearchProvider):
+    name = "Google"
+    URL = "https://www.googleapis.com/customsearch/v1"
+
+    def __init__(self, api_key, cx, timeout=5):
+        self.api_key, self.cx, self.timeout = api_key, cx, timeout
+
+    def search(self, query, mode):
+        q_str = f'(北科大 "{query}") OR ("{query}" Dcard PTT)' if mode == "analysis" else f'北科大 {query} 推薦'
+        params = {'key': self.api_key, 'cx': self.cx, 'q': q_str, 'num': 5}
+        res = _SESSION.get(self.URL, params=params, timeout=self.timeout)
+        if res.status_code != 200: return []
+        return [{"title": i.get('title'), "snippet": i.get('snippet'), "link": i.get('link')}
+                for i in res.json().get('items', [])]
+
+class TavilyProvider(SearchProvider):
+    name = "Tavily"
+
+    def __init__(self, api_key, timeout=10):
+        self.client, self.timeout = get_tavily_client(api_key), timeout
+
+    def search(self, query, mode):
+        tav_res = self.client.search(query=f"北科大 {query} 評價 Dcard PTT", search_depth="advanced",
+                                     max_results=5, timeout=self.timeout)
+        return [{"title": i.get('title'), "snippet": i.get('content', '')[:300], "link": i.get('url')}
+                for i in tav_res.get('results', [])]
+
+def format_hit(source, hit):
+    return f"[{source}] {hit['title']}\n{hit['snippet']}\nLink: {hit['link']}"
+
+def run_providers(providers, query, mode, min_results=8, deadline=8.0):
+    """同時查詢所有來源；湊滿 min_results 筆不重複結果或超過 deadline 秒即回傳，不等落後者"""
+    if not providers: return []
+    futures = {_POOL.submit(p.search, query, mode): i for i, p in enumerate(providers)}
+    hits = [[] for _ in providers]
+    seen = set()
+    try:
+        for fut in as_completed(futures, timeout=deadline):
+            idx = futures[fut]
+            try: hits[idx] = fut.result()
+            except Exception as e: print(f"{providers[idx].name} Error: {e}")
+            seen.update(normalize_url(h['link']) for h in hits[idx])
+            if len(seen) >= min_results: break
+    except FutureTimeout:
+        print(f"Search deadline ({deadline}s) reached")
+
+    # 依來源優先順序合併並以正規化後的連結去重
+    unique_results = {}
+    for p, provider_hits in zip(providers, hits):
+        for h in provider_hits:
+            key = normalize_url(h['link'])
+            if key not in unique_results: unique_results[key] = format_hit(p.name, h)
+    return list(unique_results.values())
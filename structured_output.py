@@ -0,0 +1,96 @@
+import json
+import math
+import re
+
+# ==========================================
+# 結構化輸出：回應 schema 與本地容錯 JSON 擷取
+# ==========================================
+TIER_ENUM = ["S", "A", "B", "C", "D"]
+
+INTENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intent": {"type": "string", "enum": ["recommend", "analyze"]},
+        "keywords": {"type": "string"},
+        "reason": {"type": "string"},
+    },
+    "required": ["intent", "keywords"],
+}
+
+JUDGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tier": {"type": "string", "enum": TIER_ENUM},
+        "score": {"type": "integer"},
+        "comment": {"type": "string"},
+    },
+    "required": ["tier", "score", "comment"],
+}
+
+# 最終分數 / Tier / 星等由本地計算，LLM 只負責評語
+PROSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "rank": {"type": "string"},
+        "reason": {"type": "string"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+        "details": {"type": "string"},
+    },
+    "required": ["rank", "reason", "tags", "details"],
+}
+
+# 不支援 JSON mode 的模型 (只能靠 prompt + 本地擷取)
+NO_JSON_MODE = ("gemma",)
+
+def json_config(model_name, schema):
+    if any(tag in model_name for tag in NO_JSON_MODE): return None
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+def _candidates(text):
+    yield text
+    fenced = re.findall(r"```(?:json)?\s*(.*?)```", text, re.S)
+    yield from fenced
+    # 修正常見瑕疵：全形引號、物件 / 陣列結尾多餘的逗號
+    fixed = text.replace("“", '"').replace("”", '"')
+    yield re.sub(r",\s*([}\]])", r"\1", fixed)
+
+def extract_json(text):
+    """從模型輸出中找出第一個完整的 JSON 物件；找不到回傳 None"""
+    if not text: return None
+    decoder = json.JSONDecoder()
+    for cand in _candidates(str(text).strip()):
+        try:
+            data = json.loads(cand)
+            if isinstance(data, dict): return data
+        except ValueError: pass
+        for m in re.finditer(r"{", cand):
+            try: data, _ = decoder.raw_decode(cand, m.start())
+            except ValueError: continue
+            if isinstance(data, dict): return data
+    return None
+
+def conforms(data, schema):
+    """只檢查 required 欄位與 enum / 基本型別，足以擋下壞掉的回應"""
+    if not isinstance(data, dict): return False
+    for key in schema.get("required", []):
+        if key not in data: return False
+    for key, spec in schema.get("properties", {}).items():
+        if key not in data: continue
+        value = data[key]
+        if "enum" in spec and str(value).strip().upper() not in [e.upper() for e in spec["enum"]]: return False
+        if spec["type"] == "integer":
+            # json.loads 接受 NaN / Infinity，"NaN" 字串也能轉成 float
+            try:
+                if not math.isfinite(float(value)): return False
+            except (TypeError, ValueError): return False
+        if spec["type"] == "object" and not conforms(value, spec): return False
+        if spec["type"] == "array" and not isinstance(value, list): return False
+    return True
+
+def parse_structured(text, schema):
+    """擷取並驗證；tier 統一為大寫、score 轉為 0-100 的整數"""
+    data = extract_json(text)
+    if not conforms(data, schema): return None
+    if "tier" in data: data["tier"] = str(data["tier"]).strip().upper()
+    if "score" in data: data["score"] = min(100, max(0, int(round(float(data["score"])))))
+    return data
@@ -0,0 +1,202 @@
+import io
+import os
+import threading
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+# ==========================================
+# 字型與課程卡片 (皆於行程內快取)
+# ==========================================
+FONT_PATHS = ["/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc", "C:\\Windows\\Fonts\\msjh.ttc", "C:\\Windows\\Fonts\\simhei.ttf"]
+MIN_FONT_SIZE = 10
+
+@lru_cache(maxsize=1)
+def font_path():
+    for p in FONT_PATHS:
+        if os.path.exists(p): return p
+    return None
+
+@lru_cache(maxsize=128)
+def get_font(path, size):
+    if path is None: return ImageFont.load_default()
+    return ImageFont.truetype(path, size)
+
+def load_font(size):
+    return get_font(font_path(), size)
+
+def measure(text, font):
+    l, t, r, b = font.getbbox(text)
+    return r - l, b - t
+
+@lru_cache(maxsize=1024)
+def fit_font(text, max_width, max_height, initial_size):
+    """二分搜尋可放入 (max_width, max_height) 的最大字級，回傳 (font, w, h)"""
+    lo, hi, best = MIN_FONT_SIZE + 1, int(initial_size), None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        font = load_font(mid)
+        w, h = measure(text, font)
+        if w < max_width and h < max_height: best, lo = (font, w, h), mid + 1
+        else: hi = mid - 1
+    if best: return best
+    font = load_font(MIN_FONT_SIZE)
+    return font, measure(text, font)[0], max_height
+
+def create_base_tier_list_fallback():
+    W, H = 1200, 1000
+    img = Image.new('RGB', (W, H), (30, 30, 30))
+    draw = ImageDraw.Draw(img)
+    colors = {'S': '#FF7F7F', 'A': '#FFBF7F', 'B': '#FFFF7F', 'C': '#7FFF7F', 'D': '#7F7FFF'}
+    row_h = H // 5
+    font = load_font(60)
+    for idx, (tier, color) in enumerate(colors.items()):
+        y = idx * row_h
+        draw.rectangle([(0, y), (200, y + row_h)], fill=color)
+        draw.rectangle([(0, y), (W, y + row_h)], outline='black', width=2)
+        draw.text((70, y + row_h//2 - 30), tier, fill='black', font=font)
+        draw.line([(0, y+row_h), (W, y+row_h)], fill='white', width=2)
+    return img
+
+@lru_cache(maxsize=512)
+def create_course_card(full_text, size=(150, 150)):
+    """回傳的圖片為共用快取，請勿直接修改"""
+    img = Image.new('RGBA', size, (245, 245, 245, 255))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([(0,0), (size[0]-1, size[1]-1)], outline=(50,50,50), width=3)
+    parts = full_text.split(' ')
+    course_name = parts[0] if len(parts) >= 1 else full_text
+    teacher_name = " ".join(parts[1:]) if len(parts) >= 2 else ""
+    W, H = size
+    target_w = W - 16
+    font_c, w_c, h_c = fit_font(course_name, target_w, H*0.5, int(H*0.4))
+    draw.text(((W-w_c)/2, (H*0.45-h_c)/2), course_name, fill='black', font=font_c)
+    if teacher_name:
+        font_t, w_t, h_t = fit_font(teacher_name, target_w, H*0.3, int(H*0.25))
+        draw.text(((W-w_t)/2, (H*0.75)-(h_t/2)), teacher_name, fill='gray', font=font_t)
+    return img
+
+# ==========================================
+# 榜單資料模型 (tier -> 依序排列的課程)，需要圖片時才一次繪製
+# ==========================================
+TIERS = ['S', 'A', 'B', 'C', 'D']
+
+def normalize_tier(tier):
+    tier = str(tier or "").strip().upper()
+    return tier if tier in TIERS else 'C'
+
+@lru_cache(maxsize=4)
+def load_base_image(path):
+    if path and os.path.exists(path): return Image.open(path).convert("RGBA")
+    return create_base_tier_list_fallback().convert("RGBA")
+
+class TierBoard:
+    """榜單資料 + 依版本快取的繪製結果；有 store 時資料存於共用的 BoardStore，否則只在記憶體"""
+    PADDING = 10
+
+    def __init__(self, base_path=None, store=None, key=None):
+        self.base_path = base_path
+        self.store, self.key = store, key
+        self._entries = {t: [] for t in TIERS}
+        self._version = 0
+        self._lock = threading.Lock()
+        self._render_lock = threading.RLock()
+        self._rendered = None   # (version, Image)
+        self._encoded = {}      # fmt -> (version, bytes)
+
+    @property
+    def version(self):
+        if self.store: return self.store.version(self.key)
+        return self._version
+
+    def snapshot(self):
+        """(版本, {tier: [名稱...]})"""
+        if self.store:
+            version, rows = self.store.entries(self.key)
+            entries = {t: [] for t in TIERS}
+            for tier, name in rows: entries[normalize_tier(tier)].append(name)
+            return version, entries
+        with self._lock: return self._version, {t: list(v) for t, v in self._entries.items()}
+
+    def __len__(self):
+        return sum(len(v) for v in self.snapshot()[1].values())
+
+    def add(self, name, tier, owner=None):
+        """同一課程只保留一張卡片，再次加入時移到新的 tier"""
+        tier = normalize_tier(tier)
+        if self.store:
+            self.store.add(self.key, name, tier, owner)
+            return tier
+        with self._lock:
+            if name in self._entries[tier]: return tier
+            for names in self._entries.values():
+                if name in names: names.remove(name)
+            self._entries[tier].append(name)
+            self._version += 1
+        return tier
+
+    def clear(self):
+        if self.store: return self.store.clear(self.key)
+        with self._lock:
+            self._entries = {t: [] for t in TIERS}
+            self._version += 1
+
+    def render(self):
+        """依目前資料一次畫出整張榜單；放不下的卡片換行到該 tier 的延伸列"""
+        # 同一時間只繪製一次；等待者醒來時多半已能直接取用快取
+        with self._render_lock:
+            version, entries = self.snapshot()
+            if self._rendered and self._rendered[0] == version: return self._rendered[1]
+            img = self._draw(entries)
+            self._rendered = (version, img)
+            return img
+
+    def _draw(self, entries):
+        base = load_base_image(self.base_path)
+        W, H = base.size
+        ROW_H = H // 5
+        CARD_SIZE = int(ROW_H * 0.85)
+        START_X = int(W * 0.28)
+        per_row = max(1, (W - START_X + self.PADDING) // (CARD_SIZE + self.PADDING))
+        lines = [max(1, -(-len(entries[t]) // per_row)) for t in TIERS]
+
+        img = Image.new("RGBA", (W, sum(lines) * ROW_H))
+        y0 = 0
+        for idx, tier in enumerate(TIERS):
+            band = base.crop((0, idx * ROW_H, W, (idx + 1) * ROW_H))
+            k = lines[idx]
+            img.paste(band, (0, y0))
+            if k > 1:
+                # 延伸列：取標籤文字上方的一列像素拉長成底色
+                strip = band.crop((0, int(ROW_H * 0.15), W, int(ROW_H * 0.15) + 1))
+                img.paste(strip.resize((W, (k - 1) * ROW_H), Image.NEAREST), (0, y0 + ROW_H))
+            for i, name in enumerate(entries[tier]):
+                line, col = divmod(i, per_row)
+                x = START_X + col * (CARD_SIZE + self.PADDING)
+                y = y0 + line * ROW_H + (ROW_H - CARD_SIZE) // 2
+                img.alpha_composite(create_course_card(name, size=(CARD_SIZE, CARD_SIZE)), (x, y))
+            y0 += k * ROW_H
+        return img
+
+    def encode(self, fmt="PNG"):
+        """回傳編碼後的圖片 bytes，同一版本只繪製、編碼一次"""
+        cached = self._encoded.get(fmt)
+        if cached and cached[0] == self.version: return cached[1]
+        with self._render_lock:
+            img = self.render()
+            version = self._rendered[0]
+            cached = self._encoded.get(fmt)
+            if cached and cached[0] == version: return cached[1]
+            buf = io.BytesIO()
+            img.save(buf, format=fmt)
+            self._encoded[fmt] = (version, buf.getvalue())
+        return buf.getvalue()
+
+_BOARDS = {}
+_BOARDS_LOCK = threading.Lock()
+
+def get_board(store, key, base_path=None):
+    """同一張榜單在行程內共用同一個 TierBoard (與其繪製快取)"""
+    with _BOARDS_LOCK:
+        if (store.path, key) not in _BOARDS: _BOARDS[(store.path, key)] = TierBoard(base_path, store, key)
+        return _BOARDS[(store.path, key)]
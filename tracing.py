@@ -0,0 +1,79 @@
+import contextvars
+import functools
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# ==========================================
+# 輕量追蹤：每次查詢一個 trace，各階段一個 span
+# ==========================================
+_current = contextvars.ContextVar("trace", default=None)
+
+class Trace:
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.started = time.time()
+        self.duration = None
+        self.spans = []
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock: self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock: spans = sorted(self.spans, key=lambda s: s["start"])
+        return {"trace_id": self.id, "query": self.name, "started": self.started,
+                "duration": self.duration, "spans": spans}
+
+@contextmanager
+def trace(name, log_path=None):
+    """結束時將整個 trace 以一行 JSON 附加到 log_path"""
+    tr = Trace(name)
+    token = _current.set(tr)
+    try:
+        yield tr
+    finally:
+        _current.reset(token)
+        tr.duration = round(time.perf_counter() - tr._t0, 4)
+        if log_path:
+            try:
+                with open(log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(tr.to_dict(), ensure_ascii=False, default=str) + "\n")
+            except OSError as e: print(f"Trace log Error: {e}")
+
+@contextmanager
+def span(name, **attrs):
+    """yield 的 dict 可在區塊內補上屬性 (model / cache / tokens ...)；沒有進行中的 trace 時不記錄"""
+    tr = _current.get()
+    rec = {"name": name, **attrs}
+    t = time.perf_counter()
+    try:
+        yield rec
+    except Exception:
+        rec["status"] = "error"
+        raise
+    finally:
+        if tr is not None:
+            rec["start"] = round(t - tr._t0, 4)
+            rec["duration"] = round(time.perf_counter() - t, 4)
+            tr.add(rec)
+
+def bind(fn):
+    """讓交給 thread pool 的函式沿用目前的 trace (每次 submit 前呼叫)"""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+def summarize(trace_dict):
+    spans = trace_dict["spans"]
+    llm = [s for s in spans if s.get("kind") == "llm"]
+    return {
+        "duration": trace_dict["duration"],
+        "llm_calls": sum(1 for s in llm if s.get("cache") != "hit"),
+        "cache_hits": sum(1 for s in spans if s.get("cache") == "hit"),
+        "fallbacks": sum(1 for s in llm if s.get("fallback")),
+        "prompt_tokens": sum(s.get("prompt_tokens") or 0 for s in llm),
+        "response_tokens": sum(s.get("response_tokens") or 0 for s in llm),
+    }
@@ -0,0 +1,53 @@
+import os
+
+import streamlit as st
+
+import pipeline
+
+# ==========================================
+# Streamlit 資源層：跨 rerun / session 共用的快取
+# 純 UI 的 rerun (切換分頁、語言) 只讀這些快取，不碰網路或檔案
+# ==========================================
+STATS_TTL = 30     # 側邊欄快取統計的更新間隔 (秒)
+BOARD_POLL = 5     # 檢查其他 session / 行程是否更新榜單的間隔 (秒)
+
+@st.cache_resource(show_spinner=False)
+def secret_config():
+    """st.secrets 找不到檔案時每次存取都會重新讀檔，這裡只讀一次 (修改 secrets 後需重新啟動)"""
+    config = {}
+    for key in pipeline.DEFAULTS:
+        try: value = st.secrets[key] if key in st.secrets else None
+        except FileNotFoundError: value = None
+        config[key] = value or os.getenv(key)
+    return config
+
+@st.cache_data(ttl=STATS_TTL, show_spinner=False)
+def cache_stats():
+    return {"search": pipeline.search_cache().stats(), "llm": pipeline.llm_cache().stats(),
+            "speculation": pipeline.speculation_stats(), "verdicts": pipeline.verdict_store().stats()}
+
+@st.cache_data(ttl=BOARD_POLL, show_spinner=False)
+def board_versions():
+    return pipeline.board_store().versions()
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def board_png(list_type, lang, version):
+    """同一版本的榜單只繪製、編碼一次，所有 session 共用；空榜單回傳 None"""
+    board = pipeline.get_tier_board(list_type, lang)
+    return board.encode() if len(board) else None
+
+def board_image(list_type, lang):
+    return board_png(list_type, lang, board_versions().get(f"{list_type}_{lang}", 0))
+
+@st.cache_data(show_spinner=False)
+def base_image(lang):
+    with open(pipeline.base_image_path(lang), "rb") as f: return f.read()
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def suggestions(prefix, limit=5):
+    return pipeline.course_index().complete(prefix, limit=limit)
+
+def boards_changed():
+    """本 session 更新榜單後立即反映，不等 BOARD_POLL"""
+    board_versions.clear()
+    cache_stats.clear()
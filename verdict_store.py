@@ -0,0 +1,70 @@
+import json
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+# ==========================================
+# 完整分析結果庫 (SQLite)：以正規化的「課程 老師」為 key，另記錄查詢次數供預熱
+# ==========================================
+class VerdictStore:
+    """get() 回傳 (結果, 經過秒數)；是否需要背景更新由呼叫端依經過時間決定"""
+
+    def __init__(self, path, max_age=30 * 24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS verdicts (
+                key TEXT PRIMARY KEY, query TEXT, result TEXT, created REAL)""")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS popularity (
+                key TEXT PRIMARY KEY, query TEXT, count INTEGER, last REAL)""")
+
+    def get(self, key):
+        """超過 max_age 視為不存在"""
+        with self._lock:
+            row = self._conn.execute("SELECT result, created FROM verdicts WHERE key = ?", (key,)).fetchone()
+        if row is None: return None
+        age = time.time() - row[1]
+        if age > self.max_age: return None
+        return json.loads(row[0]), age
+
+    def put(self, key, query, result):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?)",
+                               (key, query, json.dumps(result, ensure_ascii=False), time.time()))
+
+    def invalidate(self, key=None):
+        """刪除單一課程的結果；key 為 None 時全部清除。回傳刪除筆數"""
+        with self._lock, self._conn:
+            if key is None: return self._conn.execute("DELETE FROM verdicts").rowcount
+            return self._conn.execute("DELETE FROM verdicts WHERE key = ?", (key,)).rowcount
+
+    def record(self, key, query):
+        """記錄一次查詢 (供 top() 挑選預熱對象)"""
+        with self._lock, self._conn:
+            self._conn.execute("""INSERT INTO popularity VALUES (?, ?, 1, ?)
+                ON CONFLICT (key) DO UPDATE SET count = count + 1, query = excluded.query, last = excluded.last""",
+                (key, query, time.time()))
+
+    def top(self, limit=20, older_than=0):
+        """查詢次數最多、且沒有結果或結果已超過 older_than 秒的課程：[(key, query, count)]"""
+        cutoff = time.time() - older_than
+        with self._lock:
+            return self._conn.execute("""SELECT p.key, p.query, p.count FROM popularity p
+                LEFT JOIN verdicts v ON v.key = p.key
+                WHERE v.created IS NULL OR v.created < ?
+                ORDER BY p.count DESC, p.last DESC LIMIT ?""", (cutoff, limit)).fetchall()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+            queries = self._conn.execute("SELECT COALESCE(SUM(count), 0) FROM popularity").fetchone()[0]
+        return {"entries": entries, "queries": queries}
+
+@lru_cache(maxsize=None)
+def get_verdict_store(path, max_age):
+    """行程內共用同一個連線，Streamlit rerun 不會重開"""
+    return VerdictStore(path, max_age=max_age)